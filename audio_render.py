@@ -0,0 +1,148 @@
+"""
+Built-in synthesizer: renders notes to 16-bit PCM and WAV
+
+Kept apart from the app so the worker processes of its pool only import
+NumPy, not Kivy.
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+RENDER_CHUNK_SECONDS = 8.0  # Pieces are mixed in chunks of this length
+PARALLEL_MIN_NOTE_SECONDS = 250.0  # Less sounding time than this is mixed inline
+NOTE_RELEASE = 0.08  # Seconds of fade-out after each note ends
+
+# Voices the notes are played with
+VOICE_PLAIN = 0
+VOICE_BELL = 1
+VOICE_ORGAN = 2
+VOICE_LEAD = 3
+VOICE_DRUM = 4
+
+
+def _voice(voice, freq, t, n, duration, seed):
+    """Waveform of one note; `t` is seconds and `n` samples since its start"""
+    phase = 2 * np.pi * freq * t
+    if voice == VOICE_DRUM:
+        # Hash noise by sample index so chunks rendered apart still line up
+        noise = np.sin(n * 12.9898 + seed * 78.233) * 43758.5453
+        noise = 2 * (noise - np.floor(noise)) - 1
+        return (0.6 * noise + 0.4 * np.sin(phase / 2)) * np.exp(-t * 18)
+    if voice == VOICE_BELL:
+        return np.sin(phase) * np.exp(-t * 3)
+    if voice == VOICE_ORGAN:
+        return np.sin(phase) + 0.25 * np.sin(2 * phase) + 0.1 * np.sin(3 * phase)
+    if voice == VOICE_LEAD:
+        return 0.6 * sum(np.sin(k * phase) / k for k in range(1, 6))
+    return np.sin(phase) + 0.2 * np.sin(2 * phase)
+
+
+def _render_chunk(task):
+    """Mix the notes sounding in one time chunk; runs in a worker process"""
+    first, n_samples, starts, durations, pitches, velocities, voices, ids, sample_rate = task
+    buf = np.zeros(n_samples, dtype=np.float64)
+    for start, duration, pitch, velocity, voice, note_id in zip(
+            starts.tolist(), durations.tolist(), pitches.tolist(),
+            velocities.tolist(), voices.tolist(), ids.tolist()):
+        s0 = int(round(start * sample_rate))
+        s1 = int(round((start + duration + NOTE_RELEASE) * sample_rate))
+        a, b = max(s0, first), min(s1, first + n_samples)
+        if a >= b:
+            continue
+        n = np.arange(a - s0, b - s0)
+        t = n / sample_rate
+        freq = 440.0 * 2 ** ((pitch - 69) / 12)
+        envelope = np.minimum(1.0, t / 0.005) * np.clip(1 - (t - duration) / NOTE_RELEASE, 0, 1)
+        gain = 0.25 * min(velocity, 127) / 127
+        buf[a - first:b - first] += _voice(voice, freq, t, n, duration, note_id) * envelope * gain
+    return buf
+
+
+# One pool serves every render while the process lives; its workers are
+# started on first use, from a fork server (or spawned) rather than forked,
+# as the caller may be a thread of the running app
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the worker processes, if they were started"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_audio(starts, durations, pitches, velocities, voices,
+                 sample_rate=SAMPLE_RATE, parallel=True):
+    """Synthesize notes (times in seconds) into mono 16-bit PCM
+
+    The piece is split into time chunks; each chunk only sees the notes that
+    sound inside it. With enough sounding time and more than one CPU the
+    chunks are mixed in the process pool.
+    """
+    if not len(starts):
+        return np.zeros(0, dtype=np.int16)
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    ends = starts + durations + NOTE_RELEASE
+    total = int(np.ceil(ends.max() * sample_rate))
+    chunk = int(RENDER_CHUNK_SECONDS * sample_rate)
+    ids = np.arange(len(starts))
+
+    tasks = []
+    for first in range(0, total, chunk):
+        t0, t1 = first / sample_rate, (first + chunk) / sample_rate
+        mask = (starts < t1) & (ends > t0)
+        tasks.append((first, min(chunk, total - first), starts[mask], durations[mask],
+                      np.asarray(pitches)[mask], np.asarray(velocities)[mask],
+                      np.asarray(voices)[mask], ids[mask], sample_rate))
+
+    buffers = None
+    note_seconds = float(np.sum(ends - starts))
+    if (parallel and len(tasks) > 1 and (os.cpu_count() or 1) > 1
+            and note_seconds >= PARALLEL_MIN_NOTE_SECONDS):
+        try:
+            buffers = list(_render_pool().map(_render_chunk, tasks))
+        except BrokenProcessPool:
+            shutdown_pool()  # Started afresh next time
+        except (OSError, NotImplementedError, ImportError):
+            pass  # No multiprocessing support here; render inline
+    if buffers is None:
+        buffers = [_render_chunk(task) for task in tasks]
+
+    mix = np.concatenate(buffers)
+    peak = np.abs(mix).max()
+    if peak > 0.99:
+        mix *= 0.99 / peak
+    return (mix * 32767).astype(np.int16)
+
+
+def wav_bytes(pcm, sample_rate=SAMPLE_RATE):
+    """Wrap mono 16-bit PCM in a WAV container"""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.astype('<i2').tobytes())
+    return out.getvalue()
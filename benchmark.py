@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Headless benchmarks for the script -> extract -> draw -> export pipeline
+
+Measures cold startup against a target, then runs synthetic compositions
+of increasing size through the same code the app uses and writes the
+timings to JSON. Pass an earlier JSON file with --baseline to print how
+each stage moved between versions.
+
+    python benchmark.py --sizes 100 1000 10000 --output bench.json
+"""
+
+import os
+
+# No window, no console logging and no real GL context are needed
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+os.environ.setdefault('KIVY_CLIPBOARD', 'dummy')
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import main
+from kivy.metrics import dp
+from kivy.uix.scrollview import ScrollView
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+STARTUP_TARGET_SECONDS = 1.0  # Importing main.py, i.e. everything before the first frame
+HIT_PROBES = 1000
+VIEWPORT = (1280, 720)
+
+# Bars of chords, scale runs, drums and melody with a tempo change every
+# 16 bars, written the way users write scripts in the editor
+SCRIPT_TEMPLATE = '''import random
+rng = random.Random({seed})
+
+s = stream.Stream()
+scale = [60, 62, 63, 65, 67, 68, 70, 72]
+drums = [36, 38, 42, 46]
+count = 0
+bar = 0
+while count < {notes}:
+    start = bar * 4.0
+    if bar % 16 == 0:
+        s.insert(start, tempo.MetronomeMark(number=rng.choice([72, 90, 120, 140])))
+
+    root = rng.choice([48, 53, 55, 57])
+    c = chord.Chord([root, root + 3, root + 7], quarterLength=4.0)
+    c.volume.velocity = 102
+    s.insert(start, c)
+    count += 3
+
+    # Scale run up or down in eighths
+    run = scale if bar % 2 == 0 else scale[::-1]
+    for i, p in enumerate(run):
+        n = note.Note(p, quarterLength=0.5)
+        n.volume.velocity = 101
+        s.insert(start + i * 0.5, n)
+    count += len(run)
+
+    for i in range(4):
+        n = note.Note(drums[i], quarterLength=0.25)
+        n.volume.velocity = 104
+        s.insert(start + i, n)
+    count += 4
+
+    for i in range(4):
+        n = note.Note(rng.randint(72, 84), quarterLength=1.0)
+        n.volume.velocity = 103
+        s.insert(start + i, n)
+    count += 4
+    bar += 1
+
+result = s
+'''
+
+
+# Run in a fresh interpreter so every import is cold
+STARTUP_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.load_music21()
+loaded = time.perf_counter()
+print(json.dumps({'import_main': imported - start, 'music21_import': loaded - imported}), file=sys.__stdout__)
+'''
+
+
+def synthetic_script(notes, seed=0):
+    """Source of a composition script producing roughly `notes` notes"""
+    return SCRIPT_TEMPLATE.format(notes=notes, seed=seed)
+
+
+def time_runs(fn, repeat, setup=None):
+    """Wall-clock seconds of `repeat` calls to fn; setup runs untimed before each"""
+    runs = []
+    value = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        value = fn()
+        runs.append(time.perf_counter() - start)
+    return runs, value
+
+
+def drop_canvas_caches(widget):
+    """Forget the cached background and track layers so the next rebuild draws everything"""
+    widget._background_key = None
+    widget._track_keys.clear()
+
+
+def summarize(runs):
+    return {
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'mean': statistics.mean(runs),
+        'runs': runs,
+    }
+
+
+def bench_size(notes, repeat, seed, export_dir):
+    """Time every pipeline stage for one composition size"""
+    stages = {}
+    source = synthetic_script(notes, seed)
+
+    # Script execution, as run_code does it on its worker thread
+    runs, music_stream = time_runs(lambda: main.execute_script(source), repeat)
+    stages['exec'] = runs
+
+    # Stream walk and widget update; the extract cache is dropped so every run is cold
+    widget = main.PianoRollWidget()
+    runs, _ = time_runs(lambda: widget.update_from_stream(music_stream), repeat,
+                        setup=lambda: music_stream._cache.pop(main.EXTRACT_CACHE_KEY, None))
+    stages['update_from_stream'] = runs
+    table = widget.note_table
+
+    # Canvas instructions for the whole roll, then for one screen inside a scroll view
+    widget.size = (max(table.max_end() * widget.beat_scale + dp(100), VIEWPORT[0]),
+                   max(len(widget.visible_pitches) * dp(18), VIEWPORT[1]))
+    cold = lambda: drop_canvas_caches(widget)
+    runs, _ = time_runs(widget._update_canvas, repeat, setup=cold)
+    stages['update_canvas_full'] = runs
+    instructions = widget.instruction_count()
+
+    view = ScrollView(size_hint=(None, None), size=VIEWPORT, scroll_x=0.5, scroll_y=0.5)
+    widget.scroll_view = view
+    runs, _ = time_runs(widget._update_canvas, repeat, setup=cold)
+    stages['update_canvas_viewport'] = runs
+    # Rebuild with nothing changed, e.g. after selecting a note: every layer is reused
+    runs, _ = time_runs(widget._update_canvas, repeat)
+    stages['update_canvas_cached'] = runs
+
+    # Whole piece squeezed into the viewport, drawn as a density heatmap
+    widget.zoom_to((VIEWPORT[0] - dp(100)) / max(table.max_end(), 1))
+    widget.width = max(widget.content_width, VIEWPORT[0])
+    runs, _ = time_runs(widget._update_canvas, repeat, setup=cold)
+    stages['update_canvas_overview'] = runs
+    widget.reset_zoom()
+    widget.scroll_view = None
+
+    # Hit-testing as on_touch_down does it: first the index build, then lookups
+    rng = random.Random(seed)
+    rows = widget._note_layout()['note_rows']
+    probes = []
+    for i in (rng.randrange(len(table)) for _ in range(HIT_PROBES)):
+        offset, pitch, duration, velocity = table[i]
+        probes.append((widget.x + (offset + duration / 2) * widget.beat_scale,
+                       widget.y + rows[i] * dp(18) + dp(8)))
+    runs, _ = time_runs(widget._note_index, repeat, setup=widget._invalidate_layout)
+    stages['hit_index'] = runs
+    runs, _ = time_runs(lambda: [widget.notes_at(x, y) for x, y in probes], repeat)
+    stages['hit_test_%d' % HIT_PROBES] = runs
+
+    # Interval and harmony analysis behind the note details popup
+    runs, _ = time_runs(lambda: main.ScoreAnalysis(table, table.categories(widget.drum_pitches)),
+                        repeat)
+    stages['analysis'] = runs
+
+    # MIDI export through music21
+    path = os.path.join(export_dir, 'bench_%d.mid' % notes)
+    runs, _ = time_runs(lambda: music_stream.write('midi', fp=path), repeat)
+    stages['write_midi'] = runs
+
+    # Project save and cold open, which replaces re-running the script
+    path = os.path.join(export_dir, 'bench_%d%s' % (notes, main.PROJECT_EXTENSION))
+    extract = main.extract_stream(music_stream)
+    midi_data = main.ScriptResult(main.source_hash(source), music_stream, extract).midi_bytes()
+    runs, _ = time_runs(lambda: main.write_project(path, source, extract, midi_data), repeat)
+    stages['project_write'] = runs
+    runs, _ = time_runs(lambda: main.read_project(path), repeat)
+    stages['project_read'] = runs
+
+    return {
+        'notes': notes,
+        'actual_notes': len(table),
+        'canvas_instructions': instructions,
+        'stages': {name: summarize(runs) for name, runs in stages.items()},
+    }
+
+
+def bench_startup(repeat):
+    """Cold import of main.py against the startup target, and of music21 after it"""
+    runs = {}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=HERE,
+                                capture_output=True, text=True, check=True).stdout
+        for name, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            runs.setdefault(name, []).append(seconds)
+    stages = {name: summarize(stage_runs) for name, stage_runs in runs.items()}
+    return {
+        'target_seconds': STARTUP_TARGET_SECONDS,
+        'met': stages['import_main']['median'] <= STARTUP_TARGET_SECONDS,
+        'stages': stages,
+    }
+
+
+def environment():
+    import kivy
+    import music21
+    import numpy
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'kivy': kivy.__version__,
+        'music21': str(music21.VERSION_STR),
+        'numpy': numpy.__version__,
+    }
+
+
+def compare(report, baseline):
+    """Median of each stage relative to the same stage in an earlier report"""
+    previous = {entry['notes']: entry['stages'] for entry in baseline.get('results', [])}
+    lines = []
+    if 'startup' in report and 'startup' in baseline:
+        for name, stats in report['startup']['stages'].items():
+            old = baseline['startup']['stages'].get(name)
+            if old and old['median']:
+                lines.append('%8s  %-24s %10.4fs -> %10.4fs  x%.2f' % (
+                    'startup', name, old['median'], stats['median'], stats['median'] / old['median']))
+    for entry in report['results']:
+        old_stages = previous.get(entry['notes'])
+        if old_stages is None:
+            continue
+        for name, stats in entry['stages'].items():
+            old = old_stages.get(name)
+            if old is None or not old['median']:
+                continue
+            ratio = stats['median'] / old['median']
+            lines.append('%8d  %-24s %10.4fs -> %10.4fs  x%.2f' % (
+                entry['notes'], name, old['median'], stats['median'], ratio))
+    return lines
+
+
+def run(sizes, repeat, seed):
+    startup = bench_startup(repeat)
+    print('startup  ' + '  '.join(
+        '%s %.4fs' % (name, stats['median']) for name, stats in startup['stages'].items()) +
+        '  (target %.1fs %s)' % (STARTUP_TARGET_SECONDS, 'met' if startup['met'] else 'MISSED'),
+        file=sys.__stdout__, flush=True)
+    main.load_music21()  # Keep the one-off import out of the first exec timing
+    results = []
+    with tempfile.TemporaryDirectory() as export_dir:
+        for notes in sizes:
+            entry = bench_size(notes, repeat, seed, export_dir)
+            results.append(entry)
+            print('%8d notes  ' % notes + '  '.join(
+                '%s %.4fs' % (name, stats['median']) for name, stats in entry['stages'].items()),
+                file=sys.__stdout__, flush=True)
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'environment': environment(),
+        'config': {'sizes': list(sizes), 'repeat': repeat, 'seed': seed},
+        'startup': startup,
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Composition sizes in notes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write')
+    parser.add_argument('--baseline', help='Earlier JSON output to compare against')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not main.MUSIC21_AVAILABLE:
+        sys.exit('music21 is required to run the benchmarks')
+    report = run(args.sizes, args.repeat, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Wrote %s' % args.output, file=sys.__stdout__)
+    if args.baseline:
+        with open(args.baseline) as f:
+            for line in compare(report, json.load(f)):
+                print(line, file=sys.__stdout__)
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 """
 Enhanced Music21 Visual DAW - Scale Interval Display with Horizontal Scroll
+
+Run with --batch SCRIPT_OR_FOLDER... to render scripts to MIDI without the window.
 """
 
+import os
+import sys
+
+# Batch runs and the audio render pool (whose fork server or spawned workers
+# import this file as __mp_main__) never open a window: Kivy must neither parse our arguments nor need a display
+if (__name__ == "__main__" and '--batch' in sys.argv[1:]) or __name__ == "__mp_main__":
+    for key, value in (('KIVY_NO_ARGS', '1'), ('KIVY_NO_CONSOLELOG', '1'),
+                       ('KIVY_GL_BACKEND', 'mock'), ('KIVY_CLIPBOARD', 'dummy')):
+        os.environ.setdefault(key, value)
+
 import kivy
 kivy.require('2.0.0')
 
@@ -12,22 +24,43 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.codeinput import CodeInput
-from kivy.graphics import Color, Rectangle, Line, Ellipse
-from kivy.core.text import LabelBase
+from kivy.uix.filechooser import FileChooserListView
+from kivy.graphics import Canvas, Color, Rectangle, Line, Mesh, Fbo, ClearColor, ClearBuffers, Translate
+from kivy.graphics.texture import Texture
+from kivy.core.text import LabelBase, Label as CoreLabel
 from kivy.clock import Clock
 from kivy.properties import ListProperty, NumericProperty, ObjectProperty, BooleanProperty, StringProperty
 from kivy.metrics import dp, sp
+from kivy.vector import Vector
 from kivy.lang import Builder
 from kivy.core.clipboard import Clipboard
 from kivy.uix.popup import Popup
 from kivy.uix.textinput import TextInput
 
-import os
 import platform
+import shutil
 import tempfile
 import subprocess
 import traceback
+import ctypes
+import hashlib
+import importlib.util
+import json
+import argparse
+import bisect
+import mmap
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio_render import (
+    SAMPLE_RATE, VOICE_PLAIN, VOICE_BELL, VOICE_ORGAN, VOICE_LEAD, VOICE_DRUM,
+    render_audio, shutdown_pool, wav_bytes)
 
 # Conditional imports
 try:
@@ -41,11 +74,22 @@ except:
     ANDROID = False
     SDK_INT = 0
 
-try:
-    from music21 import stream, note, tempo, chord, dynamics, articulations
-    MUSIC21_AVAILABLE = True
-except ImportError:
-    MUSIC21_AVAILABLE = False
+# music21 takes seconds to import, so it is loaded on first use (or by the
+# app's background warm-up) rather than before the first frame
+MUSIC21_AVAILABLE = importlib.util.find_spec('music21') is not None
+stream = note = tempo = chord = dynamics = articulations = instrument = midi = None
+_music21_lock = threading.Lock()
+
+
+def load_music21():
+    """Import the music21 modules used here, once, from whichever thread asks first"""
+    global stream, note, tempo, chord, dynamics, articulations, instrument, midi
+    if midi is not None:
+        return
+    with _music21_lock:
+        if midi is None:
+            # midi is bound last, so seeing it set means the rest are too
+            from music21 import stream, note, tempo, chord, dynamics, articulations, instrument, midi
 
 # Font registration with fallbacks
 font_registered = False
@@ -65,7 +109,8 @@ for path in font_paths:
         pass
 
 if not font_registered:
-    LabelBase.register(name="Mono", fn_regular=LabelBase.default_font)
+    # Kivy ships a monospace font of its own
+    LabelBase.register(name="Mono", fn_regular=os.path.join(kivy.kivy_data_dir, 'fonts', 'RobotoMono-Regular.ttf'))
 
 # Android MediaPlayer Listeners
 if ANDROID:
@@ -105,6 +150,1728 @@ if ANDROID:
         def onError(self, mp, what, extra):
             return self.callback(mp, what, extra)
 
+# Caches
+class LRUCache:
+    """Thread-safe least-recently-used cache with hit/miss counters"""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Short hit-rate summary for the status bar"""
+        total = self.hits + self.misses
+        return f"{self.hits}/{total} hits" if total else "empty"
+
+
+class TextTextureCache(LRUCache):
+    """Rasterized text shared by every canvas, keyed by (text, font_size, font_name)"""
+
+    def texture(self, text, font_size, font_name='Mono'):
+        key = (text, font_size, font_name)
+        label = self.get(key)
+        if label is None:
+            # Keep the CoreLabel alive so the texture is reloaded after a GL context loss
+            label = CoreLabel(text=text, font_size=font_size, font_name=font_name)
+            label.refresh()
+            self.put(key, label)
+        return label.texture
+
+
+text_textures = TextTextureCache(max_size=512)
+
+
+# Stage timing
+TIMING_LOG_NAME = 'srimusic_timings.jsonl'
+TIMING_LOG_MAX_BYTES = 4 * 1024 * 1024  # Past this the log is rotated to one .1 backup
+TIMING_LOG_FLUSH_SECONDS = 2.0
+FRAME_TIMING_SAMPLE = 10  # Log one in this many canvas rebuilds that no run caused
+
+
+class StageTimings:
+    """Wall-clock time spent in each named stage of one operation
+
+    A disabled instance costs one attribute check per stage, so timings can
+    stay in the hot paths when instrumentation is switched off.
+    """
+
+    def __init__(self, operation, enabled=True):
+        self.operation = operation
+        self.enabled = enabled
+        self.stages = {}  # Stage name -> seconds, in the order they ran
+        self.counts = {}  # Other figures, such as canvas instruction counts
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def merge(self, other):
+        self.stages.update(other.stages)
+        self.counts.update(other.counts)
+
+    def summary(self):
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.stages.items()]
+        parts += [f"{value} {name}" for name, value in self.counts.items()]
+        return ", ".join(parts)
+
+    def record(self):
+        return {
+            'time': time.time(),
+            'operation': self.operation,
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            **self.counts,
+        }
+
+
+class TimingLog:
+    """Appends timing records to a JSON lines file
+
+    Records are buffered and written every few seconds by a background
+    thread, so appending never touches the disk on the UI thread.
+    """
+
+    def __init__(self, path, max_bytes=TIMING_LOG_MAX_BYTES, interval=TIMING_LOG_FLUSH_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._lock = threading.Lock()  # Guards the buffer
+        self._write_lock = threading.Lock()  # Guards the file
+        self._pending = []
+        self._closed = threading.Event()
+        self._thread = None
+
+    def append(self, timings):
+        if not timings.enabled or not timings.stages:
+            return
+        record = timings.record()
+        with self._lock:
+            self._pending.append(record)
+            if self._thread is None and not self._closed.is_set():
+                self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._thread.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records, rotating the file when it has grown too large"""
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return
+        data = ''.join(json.dumps(record) + '\n' for record in records)
+        with self._write_lock:
+            try:
+                try:
+                    size = os.path.getsize(self.path)
+                except OSError:
+                    size = 0
+                if size and size + len(data) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a') as f:
+                    f.write(data)
+            except OSError:
+                pass  # Timings are best effort
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        self._closed.set()
+        self.flush()
+
+# Note table
+# Categories are encoded by the demo scripts in the note velocity
+CATEGORY_OTHER = 0
+CATEGORY_SCALE = 1   # velocity 101
+CATEGORY_CHORD = 2   # velocity 102
+CATEGORY_MELODY = 3  # velocity 103
+CATEGORY_DRUM = 4    # velocity 104, or any note on a drum pitch
+VELOCITY_CATEGORIES = {
+    101: CATEGORY_SCALE,
+    102: CATEGORY_CHORD,
+    103: CATEGORY_MELODY,
+    104: CATEGORY_DRUM,
+}
+
+# Each category is one track of the piano roll, drawn in this order
+TRACK_NAMES = {
+    CATEGORY_OTHER: 'Other',
+    CATEGORY_SCALE: 'Scale',
+    CATEGORY_CHORD: 'Chords',
+    CATEGORY_MELODY: 'Melody',
+    CATEGORY_DRUM: 'Drums',
+}
+
+NOTE_COLORS = {
+    CATEGORY_DRUM: (0.9, 0.2, 0.2),    # Red
+    CATEGORY_SCALE: (1.0, 0.9, 0.2),   # Yellow
+    CATEGORY_CHORD: (0.2, 0.9, 0.3),   # Green
+    CATEGORY_MELODY: (0.2, 0.5, 1.0),  # Blue
+}
+
+DRUM_CHANNEL = 9  # Channel 10 in 1-based numbering
+
+NOTE_DTYPE = np.dtype([
+    ('offset', '<f8'),
+    ('pitch', '<i2'),
+    ('duration', '<f8'),
+    ('velocity', '<i2'),
+    ('channel', 'u1'),  # 0-based MIDI channel the note is played on
+    ('program', 'u1'),  # General MIDI program selected on that channel
+])
+
+
+class NoteTable:
+    """Columnar note store backed by a NumPy structured array"""
+
+    def __init__(self, data=None):
+        self.data = data if data is not None else np.zeros(0, dtype=NOTE_DTYPE)
+
+    @classmethod
+    def from_tuples(cls, notes):
+        """Build a table from (offset, pitch, duration, velocity[, channel, program]) tuples"""
+        data = np.array(
+            [(float(n[0]), int(n[1]), float(n[2]), int(n[3]),
+              int(n[4]) if len(n) > 4 else 0, int(n[5]) if len(n) > 5 else 0)
+             for n in notes],
+            dtype=NOTE_DTYPE)
+        return cls(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        row = self.data[i]
+        return (float(row['offset']), int(row['pitch']),
+                float(row['duration']), int(row['velocity']))
+
+    @property
+    def offset(self):
+        return self.data['offset']
+
+    @property
+    def pitch(self):
+        return self.data['pitch']
+
+    @property
+    def duration(self):
+        return self.data['duration']
+
+    @property
+    def velocity(self):
+        return self.data['velocity']
+
+    @property
+    def channel(self):
+        return self.data['channel']
+
+    @property
+    def program(self):
+        return self.data['program']
+
+    def max_end(self, default=0.0):
+        """Latest note end in beats"""
+        if not len(self.data):
+            return default
+        return float(np.max(self.offset + self.duration))
+
+    def sorted_by_pitch(self):
+        return NoteTable(self.data[np.argsort(self.pitch, kind='stable')])
+
+    def categories(self, drum_pitches=()):
+        """Category code per note; notes on drum pitches are always drums"""
+        cats = np.full(len(self.data), CATEGORY_OTHER, dtype=np.int8)
+        velocity = self.velocity
+        for vel, category in VELOCITY_CATEGORIES.items():
+            cats[velocity == vel] = category
+        if len(drum_pitches):
+            cats[pitch_mask(drum_pitches)[self.pitch]] = CATEGORY_DRUM
+        return cats
+
+
+def pitch_mask(pitches):
+    """Boolean lookup table over all 128 MIDI pitches"""
+    mask = np.zeros(128, dtype=bool)
+    mask[np.asarray(list(pitches), dtype=np.intp)] = True
+    return mask
+
+
+def pitch_rows(pitches):
+    """Map each MIDI pitch to its row in `pitches`, -1 when not shown"""
+    rows = np.full(128, -1, dtype=np.int32)
+    rows[np.asarray(list(pitches), dtype=np.intp)] = np.arange(len(pitches), dtype=np.int32)
+    return rows
+
+
+class NoteIndex:
+    """Per-row interval index answering point and rectangle queries in beats"""
+
+    def __init__(self, starts, ends, rows):
+        keep = np.flatnonzero(rows >= 0)
+        order = keep[np.lexsort((starts[keep], rows[keep]))]
+        self._ids = order
+        self._starts = starts[order]
+        self._ends = ends[order]
+        rows = rows[order].astype(np.float64)
+        n_rows = int(rows[-1]) + 1 if len(rows) else 0
+        self._bounds = np.searchsorted(rows, np.arange(n_rows + 1), side='left')
+        # Running maximum of note ends within each row; shifting every row by
+        # more than the span of ends lets one accumulate handle all rows at once
+        if len(order):
+            span = float(self._ends.max() - self._ends.min()) + 1.0
+            self._reach = np.maximum.accumulate(self._ends + rows * span) - rows * span
+        else:
+            self._reach = self._ends
+
+    def _row_hits(self, row, beat_from, beat_to):
+        if row < 0 or row + 1 >= len(self._bounds):
+            return self._ids[:0]
+        lo, hi = int(self._bounds[row]), int(self._bounds[row + 1])
+        # Notes starting after the range cannot overlap it
+        hi = lo + int(np.searchsorted(self._starts[lo:hi], beat_to, side='right'))
+        # Skip the prefix whose notes all end before the range
+        lo += int(np.searchsorted(self._reach[lo:hi], beat_from, side='left'))
+        if lo >= hi:
+            return self._ids[:0]
+        return self._ids[lo:hi][self._ends[lo:hi] >= beat_from]
+
+    def at(self, row, beat):
+        """Note indices covering `beat` in `row`, in table order"""
+        return np.sort(self._row_hits(row, beat, beat))
+
+    def in_rect(self, first_row, last_row, beat_from, beat_to):
+        """Note indices overlapping rows [first_row, last_row] and the beat range"""
+        hits = [self._row_hits(row, beat_from, beat_to)
+                for row in range(max(0, first_row), last_row + 1)]
+        if not hits:
+            return self._ids[:0]
+        return np.sort(np.concatenate(hits))
+
+
+# Score analysis
+INTERVAL_NONE = -128  # No melodic neighbour
+INTERVAL_BUCKETS = 14  # Histogram buckets: unison to octave, then anything wider
+PITCH_CLASS_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Chord qualities as pitch classes above the root
+CHORD_TEMPLATES = {
+    'major': (0, 4, 7),
+    'minor': (0, 3, 7),
+    'diminished': (0, 3, 6),
+    'augmented': (0, 4, 8),
+    'sus2': (0, 2, 7),
+    'sus4': (0, 5, 7),
+    'dominant 7th': (0, 4, 7, 10),
+    'major 7th': (0, 4, 7, 11),
+    'minor 7th': (0, 3, 7, 10),
+    'half-diminished 7th': (0, 3, 6, 10),
+    'diminished 7th': (0, 3, 6, 9),
+}
+CHORD_QUALITIES = list(CHORD_TEMPLATES)
+
+
+def _chord_lookup():
+    """Quality index and root for each of the 4096 pitch-class sets, -1 where none fits"""
+    quality = np.full(4096, -1, dtype=np.int8)
+    root = np.full(4096, -1, dtype=np.int8)
+    for index, intervals in enumerate(CHORD_TEMPLATES.values()):
+        for pitch_class in range(12):
+            mask = sum(1 << ((pitch_class + i) % 12) for i in intervals)
+            if quality[mask] < 0:  # Symmetric chords keep their lowest root
+                quality[mask] = index
+                root[mask] = pitch_class
+    return quality, root
+
+
+CHORD_QUALITY_BY_MASK, CHORD_ROOT_BY_MASK = _chord_lookup()
+
+
+def _group_starts(*keys):
+    """Boolean array marking where any of the (already sorted) keys changes"""
+    starts = np.ones(len(keys[0]), dtype=bool)
+    if len(starts) > 1:
+        starts[1:] = np.logical_or.reduce([key[1:] != key[:-1] for key in keys])
+    return starts
+
+
+class ScoreAnalysis:
+    """Interval and harmony facts for every note of a NoteTable, indexed like the table
+
+    Each category other than drums and chords is treated as one voice whose
+    line is the highest note at each onset; melodic intervals are taken
+    between consecutive onsets of that line. Non-drum notes starting
+    together form a chord, named by looking up its pitch-class set.
+    Everything is computed in a handful of numpy passes, so this is meant
+    to run once per extract on a worker thread.
+    """
+
+    def __init__(self, note_table, categories):
+        n = len(note_table)
+        offset = note_table.offset
+        pitch = note_table.pitch.astype(np.int16)
+        self.categories = categories
+        self.prev_interval = np.full(n, INTERVAL_NONE, dtype=np.int16)
+        self.next_interval = np.full(n, INTERVAL_NONE, dtype=np.int16)
+        self.chord_of = np.full(n, -1, dtype=np.intp)  # Index into chord_quality/chord_root
+
+        # Melodic intervals along the top line of each voice
+        voiced = np.flatnonzero((categories != CATEGORY_DRUM) & (categories != CATEGORY_CHORD))
+        order = voiced[np.lexsort((pitch[voiced], offset[voiced], categories[voiced]))]
+        if len(order):
+            tops = order[np.roll(_group_starts(categories[order], offset[order]), -1)]
+            a, b = tops[:-1], tops[1:]
+            same_voice = categories[a] == categories[b]
+            a, b = a[same_voice], b[same_voice]
+            self.prev_interval[b] = pitch[b] - pitch[a]
+            self.next_interval[a] = pitch[b] - pitch[a]
+
+        # Chords: pitch-class sets of non-drum notes sharing an onset, with the
+        # chord part kept apart from any line playing over it
+        harmonic = np.flatnonzero(categories != CATEGORY_DRUM)
+        in_chord_part = categories[harmonic] == CATEGORY_CHORD
+        order = harmonic[np.lexsort((offset[harmonic], in_chord_part))]
+        if len(order):
+            starts = np.flatnonzero(_group_starts(offset[order], categories[order] == CATEGORY_CHORD))
+            masks = np.bitwise_or.reduceat(1 << (pitch[order] % 12).astype(np.int32), starts)
+            group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(order))))
+            self.chord_quality = CHORD_QUALITY_BY_MASK[masks]
+            self.chord_root = CHORD_ROOT_BY_MASK[masks]
+            named = self.chord_quality[group] >= 0
+            self.chord_of[order[named]] = group[named]
+        else:
+            self.chord_quality = self.chord_root = np.zeros(0, dtype=np.int8)
+
+        # Interval histograms per category
+        self.histograms = {}
+        has_interval = self.prev_interval != INTERVAL_NONE
+        for category in np.unique(categories[has_interval]).tolist():
+            sizes = np.abs(self.prev_interval[has_interval & (categories == category)])
+            self.histograms[category] = np.bincount(
+                np.minimum(sizes, INTERVAL_BUCKETS - 1), minlength=INTERVAL_BUCKETS)
+
+    def melodic(self, i):
+        """(semitones from the previous note, semitones to the next), None where absent"""
+        prev, next_ = int(self.prev_interval[i]), int(self.next_interval[i])
+        return (None if prev == INTERVAL_NONE else prev,
+                None if next_ == INTERVAL_NONE else next_)
+
+    def chord(self, i):
+        """(root pitch class, quality name) of the chord note i belongs to, or None"""
+        group = self.chord_of[i]
+        if group < 0:
+            return None
+        return int(self.chord_root[group]), CHORD_QUALITIES[self.chord_quality[group]]
+
+    def histogram(self, category):
+        """Counts of interval sizes 0..12 semitones plus wider, for one category"""
+        return self.histograms.get(category, np.zeros(INTERVAL_BUCKETS, dtype=np.intp))
+
+
+# Tempo map
+# music21 writes no tempo event before the first mark, so MIDI players use 120
+DEFAULT_BPM = 120.0
+
+
+class TempoMap:
+    """Beat/second conversion for scores with any number of tempo changes
+
+    Tempo is constant between marks, so seconds are piecewise linear in beats:
+    each segment stores its start beat, start second and seconds per beat,
+    and lookups bisect the segment starts.
+    """
+
+    def __init__(self, marks=()):
+        beats = [0.0]
+        bpms = [DEFAULT_BPM]
+        for offset, bpm in sorted(marks, key=lambda mark: mark[0]):
+            if not bpm or bpm <= 0:
+                continue
+            offset = max(0.0, float(offset))
+            if offset <= beats[-1]:
+                bpms[-1] = float(bpm)  # Later mark at the same offset wins
+            else:
+                beats.append(offset)
+                bpms.append(float(bpm))
+        spb = [60.0 / bpm for bpm in bpms]
+        seconds = [0.0]
+        for i in range(1, len(beats)):
+            seconds.append(seconds[-1] + (beats[i] - beats[i - 1]) * spb[i - 1])
+        self.beats = beats
+        self.seconds = seconds
+        self.bpms = bpms
+        self._spb = spb
+        self._beats_array = np.array(beats)
+        self._seconds_array = np.array(seconds)
+        self._spb_array = np.array(spb)
+
+    def __len__(self):
+        return len(self.beats)
+
+    def bpm_at(self, beat):
+        return self.bpms[max(0, bisect.bisect_right(self.beats, beat) - 1)]
+
+    def seconds_at(self, beat):
+        """Seconds from the start of the score to `beat`"""
+        i = max(0, bisect.bisect_right(self.beats, beat) - 1)
+        return self.seconds[i] + (beat - self.beats[i]) * self._spb[i]
+
+    def beat_at(self, seconds):
+        """Beat reached `seconds` after the start of the score"""
+        i = max(0, bisect.bisect_right(self.seconds, seconds) - 1)
+        return self.beats[i] + (seconds - self.seconds[i]) / self._spb[i]
+
+    def seconds_for(self, beats):
+        """Vectorized seconds_at for an array of beats"""
+        beats = np.asarray(beats, dtype=np.float64)
+        i = np.maximum(np.searchsorted(self._beats_array, beats, side='right') - 1, 0)
+        return self._seconds_array[i] + (beats - self._beats_array[i]) * self._spb_array[i]
+
+
+# Stream extraction
+EXTRACT_CACHE_KEY = 'srimusicExtract'
+
+
+class StreamExtract:
+    """Everything the UI needs from a music21 stream, gathered in one walk"""
+
+    def __init__(self, note_table=None, scale_pitches=(), drum_pitches=(),
+                 scale_intervals=(), visible_pitches=(), tempo_marks=(), duration=0.0):
+        self.note_table = note_table if note_table is not None else NoteTable()
+        self.scale_pitches = list(scale_pitches)      # In order of appearance
+        self.drum_pitches = list(drum_pitches)        # In order of appearance
+        self.scale_intervals = list(scale_intervals)  # (prev, curr, semitones, prev_offset, curr_offset)
+        self.visible_pitches = list(visible_pitches)  # Sorted rows of the piano roll
+        self.tempo_marks = list(tempo_marks)          # (offset, bpm) sorted by offset
+        self.duration = duration                      # Total length in beats
+        self.tempo_map = TempoMap(self.tempo_marks)
+        self._analysis = None
+
+    @property
+    def analysis(self):
+        """ScoreAnalysis of the notes, computed on first use and kept
+
+        Parts are told apart by velocity alone: the display rule that any note
+        on a drum pitch is a drum would pull chord tones sharing a pitch with
+        the drums out of their chords.
+        """
+        if self._analysis is None:
+            table = self.note_table
+            self._analysis = ScoreAnalysis(table, table.categories())
+        return self._analysis
+
+
+MELODIC_CHANNELS = [channel for channel in range(16) if channel != DRUM_CHANNEL]
+
+
+def _instrument_channel(inst, channels):
+    """(channel, program) of the notes a music21 instrument plays
+
+    Follows music21's MIDI export: percussion is on the drum channel, an
+    instrument's own midiChannel is kept and each other program takes the
+    next free channel. `channels` maps programs to the channels given out.
+    """
+    program = inst.midiProgram if inst is not None else None
+    if isinstance(inst, instrument.UnpitchedPercussion):
+        return DRUM_CHANNEL, program or 0
+    if program not in channels:
+        if inst is not None and inst.midiChannel is not None:
+            channels[program] = inst.midiChannel
+        else:
+            free = [channel for channel in MELODIC_CHANNELS if channel not in channels.values()]
+            channels[program] = free[0] if free else 0
+    return channels[program], program or 0
+
+
+def _instrument_change(inst, voice, channels):
+    """(channel, program) after `inst` appears in a part playing on `voice`
+
+    Like music21's MIDI export, a part keeps its first channel and later
+    instruments only change its program.
+    """
+    if voice is None:
+        return _instrument_channel(inst, channels)
+    return voice[0], inst.midiProgram or 0
+
+
+def extract_stream(music_stream):
+    """Walk a music21 stream once; the result is cached on the stream itself
+
+    The cache lives in the stream's own `_cache`, which music21 clears whenever
+    elements are added or removed, so edits invalidate it automatically.
+    """
+    cache = getattr(music_stream, '_cache', None)
+    if cache is not None and EXTRACT_CACHE_KEY in cache:
+        return cache[EXTRACT_CACHE_KEY]
+    load_music21()
+
+    notes = []
+    scale_pitches = []
+    drum_pitches = []
+    scale_seen = set()
+    drum_seen = set()
+    all_pitches = set()
+    scale_notes = []
+    tempo_marks = []
+
+    # Flattening interleaves the parts, so notes are matched to the
+    # instruments of their part beforehand
+    channels = {}
+    part_voices = {}  # id(note or chord) -> (channel, program)
+    has_parts = music_stream.hasPartLikeStreams()
+    if has_parts:
+        for part in music_stream.getElementsByClass(stream.Stream):
+            part_voice = None
+            for el in part.recurse().getElementsByClass((instrument.Instrument, note.Note, chord.Chord)):
+                if isinstance(el, instrument.Instrument):
+                    part_voice = _instrument_change(el, part_voice, channels)
+                    continue
+                if part_voice is None:
+                    part_voice = _instrument_channel(None, channels)
+                part_voices[id(el)] = part_voice
+    voice = None
+
+    # Offsets of a flattened stream are from the start of the score, not of the
+    # enclosing Measure or Part
+    flat = music_stream.flatten()
+    for el in flat:
+        if isinstance(el, note.Note):
+            pitches = [el.pitch.midi]
+        elif isinstance(el, chord.Chord):
+            pitches = [n.pitch.midi for n in el.notes]
+        elif isinstance(el, tempo.MetronomeMark):
+            if el.number:
+                tempo_marks.append((float(flat.elementOffset(el)), float(el.number)))
+            continue
+        elif isinstance(el, instrument.Instrument):
+            if not has_parts:
+                voice = _instrument_change(el, voice, channels)
+            continue
+        else:
+            continue
+
+        if has_parts:
+            channel, program = part_voices.get(id(el)) or _instrument_channel(None, channels)
+        else:
+            if voice is None:
+                voice = _instrument_channel(None, channels)
+            channel, program = voice
+
+        offset = flat.elementOffset(el)
+        duration = el.duration.quarterLength
+        velocity = el.volume.velocity if hasattr(el.volume, 'velocity') else 100
+        if velocity is None:
+            velocity = 100
+
+        for midi in pitches:
+            notes.append((offset, midi, duration, velocity, channel, program))
+            all_pitches.add(midi)
+
+            # Mark drum notes (velocity 104, or played by a percussion instrument)
+            if (velocity == 104 or channel == DRUM_CHANNEL) and midi not in drum_seen:
+                drum_seen.add(midi)
+                drum_pitches.append(midi)
+
+            # Collect scale pitches (velocity 101)
+            if velocity == 101:
+                if midi not in scale_seen:
+                    scale_seen.add(midi)
+                    scale_pitches.append(midi)
+                scale_notes.append((offset, midi, duration, velocity))
+
+    # Sort scale notes by offset
+    scale_notes.sort(key=lambda x: x[0])
+
+    # Calculate intervals between consecutive scale notes
+    scale_intervals = []
+    for i in range(1, len(scale_notes)):
+        prev_note = scale_notes[i-1]
+        curr_note = scale_notes[i]
+
+        # Only calculate if they're in the same voice/part (temporal proximity)
+        if abs(curr_note[0] - prev_note[0]) < 1.0:  # Within 1 beat
+            semitones = curr_note[1] - prev_note[1]
+            if semitones != 0:  # Skip unison intervals
+                scale_intervals.append((
+                    prev_note[1],
+                    curr_note[1],
+                    semitones,
+                    prev_note[0],
+                    curr_note[0]
+                ))
+
+    # Scale and drum pitches are shown even without notes
+    all_pitches.update(scale_seen)
+    all_pitches.update(drum_seen)
+    tempo_marks.sort(key=lambda mark: mark[0])
+
+    extract = StreamExtract(
+        # Sort notes by pitch for better visualization
+        note_table=NoteTable.from_tuples(notes).sorted_by_pitch(),
+        scale_pitches=scale_pitches,
+        drum_pitches=drum_pitches,
+        scale_intervals=scale_intervals,
+        visible_pitches=sorted(all_pitches),
+        tempo_marks=tempo_marks,
+        duration=float(music_stream.duration.quarterLength),
+    )
+    if cache is not None:
+        cache[EXTRACT_CACHE_KEY] = extract
+    return extract
+
+
+# Script execution
+SCRIPT_FILENAME = '<music21 script>'
+
+
+class ScriptCancelled(BaseException):
+    """Raised inside a running script when it is cancelled or times out
+
+    Derives from BaseException so `except Exception` blocks in user scripts
+    cannot swallow it.
+    """
+
+
+def script_env():
+    """Globals available to composition scripts"""
+    load_music21()
+    return {
+        'stream': stream,
+        'note': note,
+        'tempo': tempo,
+        'chord': chord,
+        'dynamics': dynamics,
+        'articulations': articulations,
+        '__builtins__': __builtins__
+    }
+
+
+def execute_script(source):
+    """Run a composition script and return its `result` variable"""
+    code = compile(source, SCRIPT_FILENAME, 'exec')
+    local = {}
+    exec(code, script_env(), local)
+    return local.get('result')
+
+
+class ScriptResult:
+    """Stream produced by a script plus everything derived from it"""
+
+    def __init__(self, source_hash, music_stream, extract):
+        self.source_hash = source_hash
+        self.stream = music_stream
+        self.extract = extract
+        self._midi_bytes = None
+
+    def midi_bytes(self):
+        """Standard MIDI File rendering of the stream, computed once"""
+        if self._midi_bytes is None:
+            load_music21()
+            self._midi_bytes = midi.translate.music21ObjectToMidiFile(self.stream).writestr()
+        return self._midi_bytes
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+# Results of recent runs keyed by the hash of the script text
+script_results = LRUCache(max_size=16)
+
+
+class ScriptJob:
+    """One run of the editor script on a worker thread
+
+    Cancelling raises ScriptCancelled asynchronously in the worker, which
+    interrupts the script (and any music21 call it is in) at the next
+    bytecode boundary. A timer cancels the job once `timeout` seconds pass.
+    """
+    label = "Running"  # Status shown while the job is in flight
+
+    def __init__(self, source, timeout=None, timings=None):
+        self.source = source
+        self.timeout = timeout
+        self.timings = timings if timings is not None else StageTimings('run', enabled=False)
+        self.started = None
+        self.result = None
+        self.extract = None
+        self.error = None
+        self.cancel_reason = None
+        self._thread = None
+        self._timer = None
+        self._interruptible = False
+        self._lock = threading.Lock()
+
+    def start(self, on_finished=None):
+        """Run in the background and call on_finished(job) from the worker"""
+        def work():
+            self.run()
+            if self._timer:
+                self._timer.cancel()
+            if on_finished:
+                on_finished(self)
+
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=work, daemon=True)
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self.cancel, args=("Timed out",))
+            self._timer.daemon = True
+            self._timer.start()
+        self._thread.start()
+
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    @property
+    def cancelled(self):
+        return self.cancel_reason is not None
+
+    def cancel(self, reason="Cancelled"):
+        with self._lock:
+            if self.cancel_reason is not None:
+                return
+            self.cancel_reason = reason
+            if self._interruptible and self._thread is not None:
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self._thread.ident), ctypes.py_object(ScriptCancelled))
+
+    def run(self):
+        """Execute the script and extract its notes"""
+        try:
+            with self._lock:
+                if self.cancel_reason is not None:
+                    raise ScriptCancelled()
+                self._interruptible = True
+            try:
+                self.result, self.extract = self.produce()
+            finally:
+                with self._lock:
+                    self._interruptible = False
+        except ScriptCancelled:
+            self.error = ScriptCancelled(self.cancel_reason or "Cancelled")
+        except Exception as e:
+            self.error = e
+            print(traceback.format_exc())
+
+    def produce(self):
+        """Execute the script and extract its notes; runs on the worker"""
+        with self.timings.stage('exec'):
+            result = execute_script(self.source)
+        extract = None
+        if result:
+            with self.timings.stage('extract'):
+                extract = extract_stream(result)
+            with self.timings.stage('analysis'):
+                extract.analysis
+        return result, extract
+
+
+# Score files
+MIDI_EXTENSIONS = ('.mid', '.midi', '.smf')
+SCORE_EXTENSIONS = MIDI_EXTENSIONS + ('.xml', '.musicxml', '.mxl')
+
+
+class MidiFileError(ValueError):
+    """A file that cannot be read as a Standard MIDI File"""
+
+
+def _read_varlen(data, pos):
+    """Decode a variable-length quantity; returns (value, next position)"""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _parse_track(data, pos, end, notes, tempo_marks):
+    """Collect (start, pitch, length, velocity, channel, program) notes of one MTrk chunk, in ticks
+
+    A note takes the program last selected on its channel in the same track.
+    Returns the tick of the last event.
+    """
+    tick = 0
+    status = 0
+    programs = [0] * 16
+    sounding = {}  # (channel, pitch) -> [(start, velocity, program)]; the latest is released first
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        if data[pos] >= 0x80:
+            status = data[pos]
+            pos += 1
+        elif not status:
+            raise MidiFileError("Data byte without a running status")
+
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            channel = status & 0x0F
+            pitch = data[pos]
+            velocity = data[pos + 1]
+            pos += 2
+            key = (channel, pitch)
+            if kind == 0x90 and velocity:
+                sounding.setdefault(key, []).append((tick, velocity, programs[channel]))
+            elif key in sounding:
+                start, on_velocity, program = sounding[key].pop()
+                if not sounding[key]:
+                    del sounding[key]
+                notes.append((start, pitch, tick - start, on_velocity, channel, program))
+        elif kind in (0xA0, 0xB0, 0xE0):
+            pos += 2
+        elif kind == 0xC0:
+            programs[status & 0x0F] = data[pos] & 0x7F
+            pos += 1
+        elif kind == 0xD0:
+            pos += 1
+        elif status == 0xFF:
+            meta = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            if meta == 0x51 and length == 3:
+                tempo_marks.append((tick, round(60000000 / int.from_bytes(data[pos:pos + 3], 'big'), 3)))
+            pos += length
+            status = 0  # Meta events cancel running status
+            if meta == 0x2F:  # End of track
+                break
+        elif status == 0xF0 or status == 0xF7:
+            length, pos = _read_varlen(data, pos)
+            pos += length
+            status = 0
+        else:
+            raise MidiFileError(f"Unexpected status byte {status:#04x}")
+
+    # Notes still held at the end of the track stop there
+    for (channel, pitch), held in sounding.items():
+        for start, velocity, program in held:
+            notes.append((start, pitch, tick - start, velocity, channel, program))
+    return tick
+
+
+def parse_midi(data):
+    """Read a Standard MIDI File straight into a StreamExtract, without music21
+
+    `data` is any buffer supporting indexing and slicing, such as an mmap.
+    Offsets are in quarter notes and notes on channel 10 are drums.
+    """
+    if len(data) < 14 or data[:4] != b'MThd':
+        raise MidiFileError("Not a Standard MIDI File")
+    header_length = int.from_bytes(data[4:8], 'big')
+    division = int.from_bytes(data[12:14], 'big')
+    if division & 0x8000:
+        raise MidiFileError("SMPTE time division is not supported")
+    if division == 0:
+        raise MidiFileError("MIDI header has a time division of zero")
+
+    notes = []
+    tempo_marks = []
+    last_tick = 0
+    pos = 8 + header_length
+    try:
+        while pos + 8 <= len(data):
+            chunk_type = data[pos:pos + 4]
+            end = min(len(data), pos + 8 + int.from_bytes(data[pos + 4:pos + 8], 'big'))
+            if chunk_type == b'MTrk':
+                last_tick = max(last_tick, _parse_track(data, pos + 8, end, notes, tempo_marks))
+            pos = end  # Unknown chunks are skipped
+    except IndexError:
+        raise MidiFileError("MIDI file is truncated") from None
+
+    columns = np.array(notes, dtype=np.float64).reshape(-1, 6)
+    data_table = np.zeros(len(columns), dtype=NOTE_DTYPE)
+    data_table['offset'] = columns[:, 0] / division
+    data_table['pitch'] = columns[:, 1]
+    data_table['duration'] = columns[:, 2] / division
+    data_table['velocity'] = columns[:, 3]
+    data_table['channel'] = columns[:, 4]
+    data_table['program'] = columns[:, 5]
+    table = NoteTable(data_table)
+
+    drums = columns[:, 4] == DRUM_CHANNEL
+    drum_pitches = list(dict.fromkeys(columns[drums, 1].astype(int).tolist()))
+    # Tempo maps usually live in the first track; keep the last mark per tick
+    marks = dict((tick / division, bpm) for tick, bpm in sorted(tempo_marks, key=lambda mark: mark[0]))
+    return StreamExtract(
+        note_table=table.sorted_by_pitch(),
+        drum_pitches=drum_pitches,
+        visible_pitches=sorted(set(table.pitch.tolist())),
+        tempo_marks=sorted(marks.items()),
+        duration=max(table.max_end(0.0), last_tick / division),
+    )
+
+
+class ScoreFile:
+    """A score opened from disk, shown through the same interface as ScriptResult
+
+    Standard MIDI Files are displayed and played straight from their bytes;
+    the music21 stream is only parsed when something asks for it.
+    """
+
+    def __init__(self, path, extract, music_stream=None):
+        self.path = path
+        self.source_hash = None
+        self.extract = extract
+        self._stream = music_stream
+        self._midi_bytes = None
+
+    @property
+    def is_midi(self):
+        return os.path.splitext(self.path)[1].lower() in MIDI_EXTENSIONS
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            load_music21()
+            from music21 import converter
+            self._stream = converter.parse(self.path)
+        return self._stream
+
+    def midi_bytes(self):
+        if self._midi_bytes is None:
+            if self.is_midi:
+                with open(self.path, 'rb') as f:
+                    self._midi_bytes = f.read()
+            else:
+                load_music21()
+                self._midi_bytes = midi.translate.music21ObjectToMidiFile(self.stream).writestr()
+        return self._midi_bytes
+
+
+def read_score_file(path):
+    """Open a MIDI file with the native parser, anything else through music21"""
+    if os.path.splitext(path)[1].lower() in MIDI_EXTENSIONS:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise MidiFileError("File is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return ScoreFile(path, parse_midi(data))
+    load_music21()
+    from music21 import converter
+    music_stream = converter.parse(path)
+    return ScoreFile(path, extract_stream(music_stream), music_stream)
+
+
+class ScoreFileJob(ScriptJob):
+    """Open a score file on a worker thread, cancellable like a script run"""
+    label = "Opening"
+
+    def __init__(self, path, timeout=None, timings=None):
+        super().__init__(path, timeout, timings)
+        self.path = path
+
+    def produce(self):
+        with self.timings.stage('parse'):
+            score = read_score_file(self.path)
+        with self.timings.stage('analysis'):
+            score.extract.analysis
+        return score, score.extract
+
+
+# Project files
+# A fixed header, then sections aligned for zero-copy array views, then a
+# JSON index naming each section's (offset, length) and the score metadata
+PROJECT_EXTENSION = '.m21proj'
+PROJECT_FILENAME = 'last_music21_project' + PROJECT_EXTENSION
+PROJECT_MAGIC = b'M21PROJ\0'
+PROJECT_VERSION = 1
+PROJECT_HEADER = struct.Struct('<8sIIQQ')  # magic, version, reserved, index offset, index length
+PROJECT_ALIGNMENT = 64
+
+
+class ProjectFileError(ValueError):
+    """A file that cannot be read as a project"""
+
+
+# Read once at import, while there is only one thread: os.umask can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomically(path, chunks):
+    """Write byte chunks to a temporary file beside `path`, then move it into place
+
+    The file keeps the mode of the one it replaces, or gets the mode open()
+    would give a new file; mkstemp alone would leave it private to the user.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    fd, temp_path = tempfile.mkstemp(prefix='.partial-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def project_bytes(source, extract=None, midi_data=None):
+    """Contents of a project file holding source, notes, tempo map and MIDI
+
+    Without an extract only the source is stored and opening runs the script.
+    """
+    sections = [('source', source.encode('utf-8'))]
+    index = {'source_hash': source_hash(source), 'sections': {}}
+    if extract is not None:
+        table = extract.note_table
+        for name in NOTE_DTYPE.names:
+            sections.append(('notes.' + name, np.ascontiguousarray(table.data[name]).tobytes()))
+        index['extract'] = {
+            'notes': len(table),
+            'scale_pitches': [int(p) for p in extract.scale_pitches],
+            'drum_pitches': [int(p) for p in extract.drum_pitches],
+            'scale_intervals': [[int(prev), int(curr), int(semitones), float(prev_offset), float(curr_offset)]
+                                for prev, curr, semitones, prev_offset, curr_offset in extract.scale_intervals],
+            'visible_pitches': [int(p) for p in extract.visible_pitches],
+            'tempo_marks': [[float(offset), float(bpm)] for offset, bpm in extract.tempo_marks],
+            'duration': float(extract.duration),
+        }
+    if midi_data is not None:
+        sections.append(('midi', bytes(midi_data)))
+
+    chunks = []
+    pos = PROJECT_ALIGNMENT  # The header is padded to one alignment unit
+    for name, data in sections:
+        index['sections'][name] = [pos, len(data)]
+        padding = -len(data) % PROJECT_ALIGNMENT
+        chunks += [data, b'\0' * padding]
+        pos += len(data) + padding
+    index_data = json.dumps(index).encode('utf-8')
+    header = PROJECT_HEADER.pack(PROJECT_MAGIC, PROJECT_VERSION, 0, pos, len(index_data))
+
+    return b''.join([header.ljust(PROJECT_ALIGNMENT, b'\0'), *chunks, index_data])
+
+
+def write_project(path, source, extract=None, midi_data=None):
+    """Write a project file to `path`, replacing it atomically"""
+    write_atomically(path, [project_bytes(source, extract, midi_data)])
+
+
+def read_project(path):
+    """Map a project file and rebuild its ProjectFile without running the script"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < PROJECT_ALIGNMENT:
+            raise ProjectFileError("Not a project file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                return _parse_project(path, data)
+            except ProjectFileError:
+                raise
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                # Well-formed header, but the index or a section is not what it should be
+                raise ProjectFileError(f"Project file is damaged ({type(e).__name__}: {e})") from None
+
+
+def _parse_project(path, data):
+    """Build a ProjectFile from the mapped bytes of a project file"""
+    magic, version, _, index_offset, index_length = PROJECT_HEADER.unpack_from(data)
+    if magic != PROJECT_MAGIC:
+        raise ProjectFileError("Not a project file")
+    if version > PROJECT_VERSION:
+        raise ProjectFileError(f"Project file version {version} is newer than this app")
+    if index_offset + index_length > len(data):
+        raise ProjectFileError("Project file is truncated")
+    try:
+        index = json.loads(data[index_offset:index_offset + index_length])
+    except ValueError:
+        raise ProjectFileError("Project index is damaged") from None
+
+    sections = index['sections']
+    for offset, length in sections.values():
+        if offset + length > index_offset:
+            raise ProjectFileError("Project file is truncated")
+
+    def section(name):
+        offset, length = sections[name]
+        return data[offset:offset + length]
+
+    source = section('source').decode('utf-8')
+    midi_data = section('midi') if 'midi' in sections else None
+    extract = None
+    if 'extract' in index:
+        meta = index['extract']
+        count = meta['notes']
+        table = np.zeros(count, dtype=NOTE_DTYPE)
+        for name in NOTE_DTYPE.names:
+            if 'notes.' + name not in sections and name in ('channel', 'program'):
+                continue  # Saved before notes kept their channel; play them on channel 1
+            offset, length = sections['notes.' + name]
+            dtype = NOTE_DTYPE.fields[name][0]
+            if length != count * dtype.itemsize:
+                raise ProjectFileError(f"Note column '{name}' has the wrong size")
+            table[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        extract = StreamExtract(
+            note_table=NoteTable(table),
+            scale_pitches=meta['scale_pitches'],
+            drum_pitches=meta['drum_pitches'],
+            scale_intervals=[tuple(interval) for interval in meta['scale_intervals']],
+            visible_pitches=meta['visible_pitches'],
+            tempo_marks=[tuple(mark) for mark in meta['tempo_marks']],
+            duration=meta['duration'],
+        )
+    return ProjectFile(path, source, extract, midi_data)
+
+
+class ProjectFile:
+    """A saved project, shown through the same interface as ScriptResult
+
+    Notes and MIDI come from the file; the stream is only made by running
+    the saved source, which the app does in the background after opening.
+    """
+
+    def __init__(self, path, source, extract, midi_data=None):
+        self.path = path
+        self.source = source
+        self.source_hash = source_hash(source)
+        self.extract = extract
+        self._stream = None
+        self._midi_bytes = midi_data
+
+    def attach_stream(self, music_stream):
+        """Adopt the stream of a background run of the source"""
+        self._stream = music_stream
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            self._stream = execute_script(self.source)
+        return self._stream
+
+    def midi_bytes(self):
+        if self._midi_bytes is None:
+            load_music21()
+            self._midi_bytes = midi.translate.music21ObjectToMidiFile(self.stream).writestr()
+        return self._midi_bytes
+
+
+# Export queue
+EXPORT_BASENAME = "music21_demo"
+EXPORT_EXTENSIONS = {'midi': '.mid', 'musicxml': '.musicxml', 'wav': '.wav'}
+
+
+def score_key(result):
+    """Identity of a score's content, used to tell whether an export is still current"""
+    if result.source_hash is not None:
+        return result.source_hash
+    return f"{result.path}@{os.stat(result.path).st_mtime_ns}"
+
+
+def musicxml_bytes(music_stream):
+    load_music21()
+    from music21.musicxml.m21ToXml import GeneralObjectExporter
+    return GeneralObjectExporter(music_stream).parse()
+
+
+def extract_wav(extract):
+    """Built-in synthesizer rendering of every note of an extract"""
+    table = extract.note_table
+    starts = extract.tempo_map.seconds_for(table.offset)
+    ends = extract.tempo_map.seconds_for(table.offset + table.duration)
+    return render_wav(starts, ends - starts, table.pitch, table.velocity,
+                      table.categories(extract.drum_pitches))
+
+
+class ExportJob:
+    """One file produced from a score; `state` is read by the UI thread while it runs"""
+
+    def __init__(self, key, format, path, produce, timings=None):
+        self.key = key
+        self.format = format
+        self.path = path
+        self.produce = produce  # Returns the file's bytes
+        self.timings = timings if timings is not None else StageTimings('export', enabled=False)
+        self.state = 'queued'  # Then running, and done, failed or unchanged
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def pending(self):
+        return self.state in ('queued', 'running')
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+
+class ExportQueue:
+    """Produces export files on a thread pool, skipping work that is already done
+
+    A job for the same score, format and path as one in flight is merged
+    into it, and one matching the file last written to its path finishes at
+    once as 'unchanged'. music21 conversions of a stream take turns, since
+    streams are not safe to convert from two threads; audio rendering runs
+    beside them and fans out to its own process pool.
+    """
+
+    def __init__(self, max_workers=3):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self.music21_lock = threading.Lock()  # Held by producers that convert a stream
+        self._active = {}  # (key, format, path) -> job in flight
+        self._written = {}  # path -> (key, format, size, mtime) of the last file written there
+
+    def submit(self, key, format, path, produce, timings=None):
+        with self._lock:
+            job = self._active.get((key, format, path))
+            if job is not None:
+                return job
+            job = ExportJob(key, format, path, produce, timings)
+            if self._is_current(job):
+                job.state = 'unchanged'
+                return job
+            self._active[(key, format, path)] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _is_current(self, job):
+        written = self._written.get(job.path)
+        if written is None:
+            return False
+        try:
+            stat = os.stat(job.path)
+        except OSError:
+            return False
+        return written == (job.key, job.format, stat.st_size, stat.st_mtime_ns)
+
+    def _run(self, job):
+        job.started = time.perf_counter()
+        job.state = 'running'
+        try:
+            with job.timings.stage('convert'):
+                data = job.produce()
+            with job.timings.stage('write'):
+                write_atomically(job.path, [data])
+            stat = os.stat(job.path)
+            with self._lock:
+                self._written[job.path] = (job.key, job.format, stat.st_size, stat.st_mtime_ns)
+            job.state = 'done'
+        except Exception as e:
+            job.error = e
+            job.state = 'failed'
+            print(traceback.format_exc())
+        finally:
+            job.finished = time.perf_counter()
+            with self._lock:
+                self._active.pop((job.key, job.format, job.path), None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Batch rendering
+BATCH_SUMMARY_NAME = 'summary.json'
+BATCH_TIMEOUT = 30  # Seconds per script, as for Run in the app
+
+
+def _batch_worker_init():
+    """Import music21 once per worker process rather than once per script"""
+    load_music21()
+
+
+def extract_summary(extract):
+    """Note counts, length and interval/harmony analysis of an extract, ready for JSON"""
+    analysis = extract.analysis
+    categories = extract.note_table.categories(extract.drum_pitches)  # As the piano roll shows them
+    chords = analysis.chord_quality[analysis.chord_quality >= 0]
+    chord_counts = np.bincount(chords, minlength=len(CHORD_QUALITIES)).tolist()
+    return {
+        'notes': len(extract.note_table),
+        'tracks': {name: int(np.count_nonzero(categories == track)) for track, name in TRACK_NAMES.items()},
+        'duration_beats': float(extract.duration),
+        'duration_seconds': float(extract.tempo_map.seconds_at(extract.duration)),
+        'tempo_marks': [[float(offset), float(bpm)] for offset, bpm in extract.tempo_marks],
+        'chords': {quality: count for quality, count in zip(CHORD_QUALITIES, chord_counts) if count},
+        'interval_histograms': {TRACK_NAMES[track]: histogram.tolist()
+                                for track, histogram in analysis.histograms.items()},
+    }
+
+
+def render_script(script_path, midi_path, timeout=BATCH_TIMEOUT):
+    """Run one script the way Run does and write its MIDI; returns its summary entry"""
+    timings = StageTimings('batch')
+    entry = {'script': script_path, 'midi': None}
+    try:
+        with timings.stage('read'):
+            with open(script_path, encoding='utf-8') as f:
+                source = f.read()
+        job = ScriptJob(source, timeout=timeout, timings=timings)
+        finished = threading.Event()
+        job.start(lambda job: finished.set())
+        finished.wait()
+        if job.error is not None:
+            raise job.error
+        if not job.result:
+            raise ValueError("No 'result' variable found")
+        with timings.stage('midi'):
+            data = ScriptResult(source_hash(source), job.result, job.extract).midi_bytes()
+        with timings.stage('write'):
+            write_atomically(midi_path, [data])
+        entry.update(status='ok', midi=midi_path, **extract_summary(job.extract))
+    except (Exception, ScriptCancelled) as e:
+        entry.update(status='error', error=f"{type(e).__name__}: {e}")
+    entry['timings_ms'] = {name: round(seconds * 1000, 3) for name, seconds in timings.stages.items()}
+    return entry
+
+
+def batch_scripts(paths):
+    """Script files named directly or found (non-recursively) in folders, in order"""
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts += sorted(os.path.join(path, name) for name in os.listdir(path)
+                              if name.endswith('.py'))
+        else:
+            scripts.append(path)
+    return scripts
+
+
+def run_batch(paths, output_dir, workers=None, timeout=BATCH_TIMEOUT):
+    """Render scripts to MIDI across a process pool and write a JSON summary
+
+    Prints one line per script as it completes and returns the summary.
+    """
+    scripts = batch_scripts(paths)
+    os.makedirs(output_dir, exist_ok=True)
+    targets = []
+    used = set()
+    for script in scripts:
+        stem = os.path.splitext(os.path.basename(script))[0]
+        name, n = stem, 1
+        while name in used:  # Same file name in different folders
+            n += 1
+            name = f"{stem}-{n}"
+        used.add(name)
+        targets.append(os.path.join(output_dir, name + '.mid'))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(scripts)))
+    start = time.perf_counter()
+    entries = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_batch_worker_init) as pool:
+        futures = {pool.submit(render_script, script, target, timeout): script
+                   for script, target in zip(scripts, targets)}
+        for future in as_completed(futures):
+            script = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:  # The worker itself died
+                entry = {'script': script, 'midi': None, 'status': 'error',
+                         'error': f"{type(e).__name__}: {e}", 'timings_ms': {}}
+            entries[script] = entry
+            seconds = sum(entry['timings_ms'].values()) / 1000
+            if entry['status'] == 'ok':
+                print(f"ok     {script}: {entry['notes']} notes, {seconds:.2f}s")
+            else:
+                print(f"error  {script}: {entry['error']}")
+
+    results = [entries[script] for script in scripts]
+    failed = sum(entry['status'] != 'ok' for entry in results)
+    summary = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'scripts': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'workers': workers,
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'results': results,
+    }
+    summary_path = os.path.join(output_dir, BATCH_SUMMARY_NAME)
+    write_atomically(summary_path, [json.dumps(summary, indent=2).encode('utf-8')])
+    summary['path'] = summary_path
+    return summary
+
+
+def batch_main(argv=None):
+    """Entry point of `main.py --batch`; returns the process exit code"""
+    parser = argparse.ArgumentParser(
+        prog='main.py',
+        description="Render composition scripts to MIDI and analysis without opening the window")
+    parser.add_argument('--batch', nargs='+', required=True, metavar='SCRIPT',
+                        help='Scripts, or folders of *.py scripts')
+    parser.add_argument('--output', default='batch_output', help='Folder for the MIDI files and summary')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--timeout', type=float, default=BATCH_TIMEOUT,
+                        help='Seconds before a script is stopped')
+    sys.stderr = sys.__stderr__  # Kivy routes stderr into its log, which is muted here
+    args = parser.parse_args(argv)
+    if not MUSIC21_AVAILABLE:
+        print("Error: music21 not installed", file=sys.stderr)
+        return 2
+    summary = run_batch(args.batch, args.output, args.jobs, args.timeout)
+    print(f"{summary['succeeded']} of {summary['scripts']} scripts rendered in "
+          f"{summary['wall_seconds']:.1f}s with {summary['workers']} workers; summary in {summary['path']}")
+    return 1 if summary['failed'] else 0
+
+
+# Offline audio rendering
+# Each category of the piano roll has its own voice in the built-in synthesizer
+CATEGORY_VOICES = np.zeros(max(TRACK_NAMES) + 1, dtype=np.int8)
+CATEGORY_VOICES[[CATEGORY_OTHER, CATEGORY_SCALE, CATEGORY_CHORD, CATEGORY_MELODY, CATEGORY_DRUM]] = [
+    VOICE_PLAIN, VOICE_BELL, VOICE_ORGAN, VOICE_LEAD, VOICE_DRUM]
+
+# Rendered WAV files keyed by a hash of the notes they were made from
+audio_renders = LRUCache(max_size=4)
+
+
+def render_wav(starts, durations, pitches, velocities, categories, sample_rate=SAMPLE_RATE):
+    """Rendered WAV bytes, reused while the notes are unchanged"""
+    digest = hashlib.sha1()
+    for column, dtype in ((starts, '<f8'), (durations, '<f8'), (pitches, '<i2'),
+                          (velocities, '<i2'), (categories, '<i1')):
+        digest.update(np.ascontiguousarray(column, dtype=dtype).tobytes())
+    key = (digest.hexdigest(), sample_rate)
+    wav = audio_renders.get(key)
+    if wav is None:
+        voices = CATEGORY_VOICES[np.asarray(categories, dtype=np.intp)]
+        pcm = render_audio(starts, durations, pitches, velocities, voices, sample_rate,
+                           parallel=not ANDROID)
+        wav = wav_bytes(pcm, sample_rate)
+        audio_renders.put(key, wav)
+    return wav
+
+
+# Linux synthesizer
+SOUNDFONT_PATH = "/usr/share/sounds/sf2/FluidR3_GM.sf2"
+
+
+def note_events(note_table, tempo_map, start_beat=0.0):
+    """Time-sorted (seconds, command) pairs for the fluidsynth shell
+
+    Times are measured from `start_beat`; notes ending before it are dropped.
+    Notes play on their own channel, and a program change is sent before the
+    first note of each channel and whenever its program differs.
+    """
+    if not len(note_table):
+        return []
+    origin = tempo_map.seconds_at(start_beat)
+    starts = np.maximum(tempo_map.seconds_for(note_table.offset) - origin, 0.0)
+    ends = tempo_map.seconds_for(note_table.offset + note_table.duration) - origin
+    keep = ends > 0
+    note_table = NoteTable(note_table.data[keep])
+    starts, ends = starts[keep], ends[keep]
+    pitches = np.clip(note_table.pitch, 0, 127).tolist()
+    velocities = np.clip(note_table.velocity, 1, 127).tolist()
+    channels = np.minimum(note_table.channel, 15).tolist()
+    programs = np.minimum(note_table.program, 127).tolist()
+    count = len(pitches)
+    times = np.concatenate([ends, starts])
+    # Note-offs sort before note-ons at the same instant so repeated notes retrigger
+    kinds = np.concatenate([np.zeros(count, np.int8), np.ones(count, np.int8)])
+    order = np.lexsort((kinds, times))
+    times = times.tolist()
+
+    events = []
+    selected = {}  # Channel -> program last sent to it
+    for i in order.tolist():
+        if i < count:
+            events.append((times[i], f"noteoff {channels[i]} {pitches[i]}"))
+            continue
+        i -= count
+        channel, program = channels[i], programs[i]
+        if selected.get(channel) != program:
+            selected[channel] = program
+            events.append((times[i + count], f"prog {channel} {program}"))
+        events.append((times[i + count], f"noteon {channel} {pitches[i]} {velocities[i]}"))
+    return events
+
+
+class FluidSynthEngine:
+    """Resident fluidsynth process driven through its command shell on stdin
+
+    The soundfont is loaded once when the process starts. Each play() streams
+    note on/off commands from a sequencer thread, so playback starts at once
+    and its end (or a crash of the synth) is reported through on_finished.
+    """
+
+    def __init__(self, soundfont=SOUNDFONT_PATH):
+        self.soundfont = soundfont
+        self.process = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._play_id = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Launch fluidsynth unless it is running; FileNotFoundError if missing"""
+        with self._lock:
+            if self.is_alive():
+                return
+            self.process = subprocess.Popen(
+                ["fluidsynth", "-a", "alsa", "-g", "1.0", self.soundfont],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1
+            )
+
+    def send(self, command):
+        """Write one shell command; returns False if the synth has died"""
+        with self._lock:
+            if not self.is_alive():
+                return False
+            try:
+                self.process.stdin.write(command + "\n")
+                self.process.stdin.flush()
+                return True
+            except (BrokenPipeError, OSError, ValueError):
+                return False
+
+    def play(self, note_table, tempo_map, on_finished=None, start_beat=0.0):
+        """Start sequencing a note table; on_finished(play_id, error) runs on the sequencer thread"""
+        self.stop()
+        self.start()
+        self._play_id += 1
+        play_id = self._play_id
+        events = note_events(note_table, tempo_map, start_beat)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sequence,
+            args=(events, self._stop_event, play_id, on_finished),
+            daemon=True)
+        self._thread.start()
+        return play_id
+
+    def _sequence(self, events, stop_event, play_id, on_finished):
+        error = None
+        start = time.perf_counter()
+        for when, command in events:
+            delay = when - (time.perf_counter() - start)
+            if delay > 0 and stop_event.wait(delay):
+                return  # Stopped; stop() silences the synth
+            if not self.send(command):
+                error = "FluidSynth exited unexpectedly"
+                break
+        if on_finished and not stop_event.is_set():
+            on_finished(play_id, error)
+
+    def stop(self):
+        """Stop the current sequence and silence all channels"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=0.5)
+        self._thread = None
+        self.send("reset")
+
+    def shutdown(self):
+        """Stop playback and terminate the synth process"""
+        self.stop()
+        if self.is_alive():
+            self.send("quit")
+            try:
+                self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+        self.process = None
+
+
+# Batched geometry
+# Mesh indices are 16-bit, so one Mesh holds at most 65536 vertices
+MESH_MAX_VERTICES = 65536
+RECT_FILL = np.array([0, 1, 2, 0, 2, 3])
+RECT_OUTLINE = np.array([0, 1, 1, 2, 2, 3, 3, 0])
+CHAMFER_FILL = np.array([0, 1, 2, 0, 2, 3, 0, 3, 4, 0, 4, 5, 0, 5, 6, 0, 6, 7])
+CHAMFER_OUTLINE = np.array([0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 0])
+SEGMENT = np.array([0, 1])
+
+
+def _vertices(px, py):
+    """Pack per-item corner coordinates (n, k) into x, y, u, v vertices (n, k, 4)"""
+    vertices = np.zeros(px.shape + (4,), dtype=np.float32)
+    vertices[..., 0] = px
+    vertices[..., 1] = py
+    return vertices
+
+
+def rect_vertices(xs, ys, ws, hs):
+    x0, y0 = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    x1, y1 = x0 + ws, y0 + hs
+    return _vertices(np.stack([x0, x1, x1, x0], axis=1),
+                     np.stack([y0, y0, y1, y1], axis=1))
+
+
+def chamfered_vertices(xs, ys, ws, h, r):
+    """Octagons approximating rounded note rectangles"""
+    x0, y0 = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    ws = np.asarray(ws, dtype=np.float64)
+    x1, y1 = x0 + ws, y0 + h
+    r = np.minimum(r, np.minimum(ws, h) / 2)
+    return _vertices(
+        np.stack([x0 + r, x1 - r, x1, x1, x1 - r, x0 + r, x0, x0], axis=1),
+        np.stack([y0, y0, y0 + r, y1 - r, y1, y1, y1 - r, y0 + r], axis=1))
+
+
+def segment_vertices(x0s, y0s, x1s, y1s):
+    return _vertices(np.stack([x0s, x1s], axis=1).astype(np.float64),
+                     np.stack([y0s, y1s], axis=1).astype(np.float64))
+
+
+def draw_meshes(vertices, template, mode):
+    """Emit Mesh instructions for items sharing one index template
+
+    `vertices` is (n, k, 4); items are split across as many meshes as the
+    16-bit index limit requires.
+    """
+    n, k = vertices.shape[:2]
+    if not n:
+        return
+    per_mesh = MESH_MAX_VERTICES // k
+    for start in range(0, n, per_mesh):
+        chunk = vertices[start:start + per_mesh]
+        indices = (np.arange(len(chunk))[:, None] * k + template[None, :]).astype(np.uint16)
+        Mesh(vertices=chunk.ravel(), indices=indices.ravel(), mode=mode)
+
+
 # UI Layout Definition
 Builder.load_string('''
 <MainLayout>:
@@ -133,8 +1900,9 @@ Builder.load_string('''
     
     BoxLayout:
         size_hint_y: 0.4
-        ScrollView:
+        PianoScrollView:
             id: piano_scroll
+            roll: piano_roll
             do_scroll_x: True
             do_scroll_y: True
             bar_width: dp(10)
@@ -143,8 +1911,10 @@ Builder.load_string('''
             scroll_type: ['bars', 'content']
             PianoRollWidget:
                 id: piano_roll
+                scroll_view: piano_scroll
+                timing_enabled: app.timing_enabled
                 size_hint_x: None
-                width: max(self.minimum_width, root.width)
+                width: max(self.content_width, root.width)
     
     BoxLayout:
         size_hint_y: None
@@ -152,45 +1922,63 @@ Builder.load_string('''
         spacing: dp(5)
         
         Button:
-            text: 'Run'
-            size_hint_x: 0.12
-            background_color: 0.2, 0.8, 0.2, 1
-            on_press: app.run_code()
+            text: 'Cancel' if app.is_running else 'Run'
+            size_hint_x: 0.1
+            background_color: (0.9, 0.5, 0.1, 1) if app.is_running else (0.2, 0.8, 0.2, 1)
+            on_press: app.cancel_run() if app.is_running else app.run_code()
+        
+        ToggleButton:
+            text: 'Live'
+            size_hint_x: 0.1
+            state: 'down' if app.live_mode else 'normal'
+            on_state: app.live_mode = self.state == 'down'
         
         Button:
             text: 'Play'
-            size_hint_x: 0.12
+            size_hint_x: 0.1
             background_color: 0.2, 0.5, 0.9, 1
             on_press: app.play_audio()
         
         Button:
             text: 'Stop'
-            size_hint_x: 0.12
+            size_hint_x: 0.1
             background_color: 0.9, 0.2, 0.2, 1
             on_press: app.stop_audio()
         
         Button:
             text: 'Export'
-            size_hint_x: 0.12
+            size_hint_x: 0.1
             background_color: 0.8, 0.6, 0.2, 1
-            on_press: app.export_midi()
+            on_press: app.export_score()
         
         Button:
             text: 'Save'
-            size_hint_x: 0.12
+            size_hint_x: 0.1
             background_color: 0.4, 0.4, 0.8, 1
             on_press: app.save_code()
         
         Button:
             text: 'Load'
-            size_hint_x: 0.12
+            size_hint_x: 0.1
             background_color: 0.6, 0.4, 0.8, 1
             on_press: app.load_code()
         
+        Button:
+            text: 'Open'
+            size_hint_x: 0.1
+            background_color: 0.3, 0.6, 0.6, 1
+            on_press: app.open_file()
+        
+        Button:
+            text: 'Tracks'
+            size_hint_x: 0.1
+            background_color: 0.5, 0.5, 0.5, 1
+            on_press: app.show_tracks()
+        
         Label:
             id: status_label
             text: app.status_text
-            size_hint_x: 0.28
+            size_hint_x: 0.2
             halign: 'left'
             valign: 'middle'
             text_size: self.width, None
@@ -219,6 +2007,64 @@ Builder.load_string('''
             text: 'Close'
             size_hint_y: 0.1
             on_press: root.dismiss()
+
+<OpenFilePopup>:
+    size_hint: 0.9, 0.9
+    title: 'Open MIDI or MusicXML file'
+    BoxLayout:
+        orientation: 'vertical'
+        spacing: dp(5)
+        FileChooserListView:
+            id: chooser
+            path: root.start_path
+            filters: root.filters
+            on_submit: root.choose(self.selection[0])
+        BoxLayout:
+            size_hint_y: None
+            height: dp(44)
+            spacing: dp(5)
+            Button:
+                text: 'Cancel'
+                on_press: root.dismiss()
+            Button:
+                text: 'Open'
+                disabled: not chooser.selection
+                on_press: root.choose(chooser.selection[0])
+
+<TrackRow>:
+    size_hint_y: None
+    height: dp(44)
+    spacing: dp(5)
+    Label:
+        text: root.name
+        size_hint_x: 0.5
+    ToggleButton:
+        text: 'Show'
+        size_hint_x: 0.25
+        state: 'down' if root.shown else 'normal'
+        on_state: root.shown = self.state == 'down'
+    ToggleButton:
+        text: 'Mute'
+        size_hint_x: 0.25
+        state: 'down' if root.muted else 'normal'
+        on_state: root.muted = self.state == 'down'
+
+<TracksPopup>:
+    size_hint: 0.6, 0.7
+    title: 'Tracks'
+    BoxLayout:
+        orientation: 'vertical'
+        padding: dp(10)
+        spacing: dp(5)
+        BoxLayout:
+            id: rows
+            orientation: 'vertical'
+            spacing: dp(5)
+        Button:
+            text: 'Close'
+            size_hint_y: None
+            height: dp(44)
+            on_press: root.dismiss()
 ''')
 
 class MainLayout(BoxLayout):
@@ -227,9 +2073,107 @@ class MainLayout(BoxLayout):
 class NoteDetailsPopup(Popup):
     note_details = StringProperty("")
 
+class OpenFilePopup(Popup):
+    start_path = StringProperty("")
+    filters = ListProperty([])
+    on_choose = ObjectProperty(None)  # Called with the chosen path
+
+    def choose(self, path):
+        self.dismiss()
+        if self.on_choose:
+            self.on_choose(path)
+
+class TrackRow(BoxLayout):
+    """Show and mute toggles for one track of a piano roll"""
+    roll = ObjectProperty(None, allownone=True)
+    track = NumericProperty(CATEGORY_OTHER)
+    name = StringProperty("")
+    shown = BooleanProperty(True)
+    muted = BooleanProperty(False)
+
+    def on_shown(self, instance, shown):
+        if self.roll:
+            self.roll.set_track_hidden(self.track, not shown)
+
+    def on_muted(self, instance, muted):
+        if self.roll:
+            self.roll.set_track_muted(self.track, muted)
+
+class TracksPopup(Popup):
+    roll = ObjectProperty(None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        counts = self.roll.track_counts()
+        for track, name in TRACK_NAMES.items():
+            self.ids.rows.add_widget(TrackRow(
+                roll=self.roll,
+                track=track,
+                name=f"{name} ({counts[track]})",
+                shown=track not in self.roll.hidden_tracks,
+                muted=track in self.roll.muted_tracks))
+
+class PianoScrollView(ScrollView):
+    """ScrollView that zooms its piano roll with a pinch or Ctrl + mouse wheel"""
+    roll = ObjectProperty(None, allownone=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._touches = []  # Finger touches currently down on the view
+        self._pinch = None  # (start distance, start beat_scale) while pinching
+
+    def _pinch_state(self):
+        a, b = self._touches[:2]
+        distance = Vector(a.pos).distance(b.pos)
+        center_x = self.to_local((a.x + b.x) / 2, (a.y + b.y) / 2)[0]
+        return distance, center_x
+
+    def on_touch_down(self, touch):
+        roll = self.roll
+        if roll is None or not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+
+        if touch.is_mouse_scrolling:
+            from kivy.core.window import Window
+            if 'ctrl' in Window.modifiers and touch.button in ('scrollup', 'scrolldown'):
+                # Kivy reports the wheel turned away from the user as 'scrolldown'
+                factor = roll.zoom_step if touch.button == 'scrolldown' else 1 / roll.zoom_step
+                roll.zoom(factor, self.to_local(*touch.pos)[0])
+                return True
+            return super().on_touch_down(touch)
+
+        self._touches.append(touch)
+        if len(self._touches) == 2:
+            # A second finger turns scrolling into pinch zoom
+            touch.grab(self)
+            self._pinch = (self._pinch_state()[0], roll.beat_scale)
+            return True
+        return super().on_touch_down(touch)
+
+    def on_touch_move(self, touch):
+        if self._pinch is not None and touch in self._touches[:2]:
+            start_distance, start_scale = self._pinch
+            distance, center_x = self._pinch_state()
+            if start_distance > 0 and distance > 0:
+                self.roll.zoom_to(start_scale * distance / start_distance, center_x)
+            return True
+        return super().on_touch_move(touch)
+
+    def on_touch_up(self, touch):
+        if touch in self._touches:
+            self._touches.remove(touch)
+            if len(self._touches) < 2:
+                self._pinch = None
+            if touch.grab_current is self and touch is not self._touch:
+                # The pinch finger never went through the ScrollView's own handling
+                touch.ungrab(self)
+                return True
+        return super().on_touch_up(touch)
+
+
 class PianoRollWidget(BoxLayout):
-    notes = ListProperty([])
-    beat_scale = NumericProperty(dp(50))
+    note_table = ObjectProperty(NoteTable(), rebind=False)
+    beat_scale = NumericProperty(dp(50))  # Pixels per beat, i.e. the horizontal zoom
     pitch_range = range(36, 84)  # MIDI note range (C2 to B5)
     current_time = NumericProperty(0)
     is_playing = BooleanProperty(False)
@@ -238,70 +2182,330 @@ class PianoRollWidget(BoxLayout):
     scale_intervals = ListProperty([])  # To store interval information
     drum_pitches = ListProperty([])    # To store drum pitches
     visible_pitches = ListProperty([]) # Combined list of pitches to display
-    minimum_width = NumericProperty(0)  # For horizontal scrolling
+    content_width = NumericProperty(0)  # For horizontal scrolling (BoxLayout owns minimum_width)
+    scroll_view = ObjectProperty(None, allownone=True)  # Enclosing ScrollView
+    timing_enabled = BooleanProperty(True)  # Time each canvas rebuild
+    frame_timings = ObjectProperty(None, allownone=True)  # StageTimings of the last rebuild
+    hidden_tracks = ListProperty([])  # Categories neither drawn nor hit-tested
+    muted_tracks = ListProperty([])  # Categories drawn faded and left out of playback
+    viewport_margin = 0.5  # Extra area drawn around the viewport, in viewports
+    follow_interval = 1 / 30.  # Minimum seconds between auto-scroll steps
+    follow_smoothing = 0.3  # Fraction of the remaining distance scrolled per step
+    default_beat_scale = dp(50)
+    min_beat_scale = dp(0.25)
+    max_beat_scale = dp(400)
+    zoom_step = 1.25  # Zoom factor per key press or wheel click
+    density_beat_scale = dp(6)  # Below this notes are drawn as a density heatmap
+    max_fbo_size = 4096  # Largest background texture; bigger areas are drawn directly
+    note_alpha = 0.7
+    muted_alpha = 0.25
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.size_hint_y = None
         self.height = len(self.pitch_range) * dp(18)
+        # Redraws are coalesced into one rebuild per frame
+        self._redraw_trigger = Clock.create_trigger(self._update_canvas, -1)
+        self._batch_depth = 0
+        self._redraw_pending = False
+        self._drawn_window = None
+        self._watched_scroll_view = None
         self.bind(
-            size=self._update_canvas,
-            pos=self._update_canvas,
-            notes=self._update_canvas,
+            size=self.request_redraw,
+            pos=self.request_redraw,
+            beat_scale=self._update_content_width,
+            note_table=self._invalidate_layout,
             current_time=self._update_playhead,
-            scale_pitches=self._update_canvas,
-            scale_intervals=self._update_canvas,
-            drum_pitches=self._update_canvas,
-            visible_pitches=self._update_canvas
+            is_playing=self._place_playhead,
+            scale_pitches=self._invalidate_layout,
+            drum_pitches=self._invalidate_layout,
+            visible_pitches=self._invalidate_layout,
+            hidden_tracks=self._attach_track_layers,
+            muted_tracks=self.request_redraw
+        )
+        # The cached background only depends on the rows and scale, not on the notes
+        self.bind(
+            visible_pitches=self._invalidate_background,
+            scale_pitches=self._invalidate_background,
+            scale_intervals=self._invalidate_background,
+            drum_pitches=self._invalidate_background
         )
-        self.playhead_line = None
+        self._background_key = None
+        self._background_fbo = None
+        self._layout = None
+
+        # Cached background, one cached layer per track, the selection redrawn
+        # every time and a persistent playhead that is only moved
+        self._background_layer = Canvas()
+        self._content_layer = Canvas()  # Holds the layers of the shown tracks
+        self._track_layers = {track: Canvas() for track in TRACK_NAMES}
+        self._track_keys = {}  # Track -> what its layer was last drawn for
+        self._selection_layer = Canvas()
+        self._playhead_layer = Canvas()
+        with self._playhead_layer:
+            self._playhead_color = Color(1, 0, 0, 0)
+            self._playhead_line = Line(points=[0, 0, 0, 0], width=dp(2))
+        self.canvas.after.add(self._background_layer)
+        self.canvas.after.add(self._content_layer)
+        self.canvas.after.add(self._selection_layer)
+        self.canvas.after.add(self._playhead_layer)
+        self._attach_track_layers()
+        self._follow_target = None
+        self._last_follow = 0
         self._key_colors = {}
         self._init_key_colors()
         self.selected_note = None
         self.note_popup = None
-        self.scroll_view = None
+        self._extract = None  # StreamExtract shown, carrying the cached analysis
         
     def _init_key_colors(self):
         """Initialize colors for piano keys (black/white)"""
         black_keys = {1, 3, 6, 8, 10}  # Semitone offsets for black keys
-        for pitch in self.pitch_range:
+        for pitch in range(128):
             if (pitch % 12) in black_keys:
                 self._key_colors[pitch] = (0.15, 0.15, 0.15, 1)  # Black keys
             else:
                 self._key_colors[pitch] = (0.95, 0.95, 0.95, 1)  # White keys
+
+    def _invalidate_layout(self, *args):
+        self._update_content_width()
+        self._layout = None
+        self.request_redraw()
+
+    def _update_content_width(self, *args):
+        # Kept current eagerly so zooming can rescroll against the new width
+        max_beat = self.note_table.max_end(default=10)
+        self.content_width = max_beat * self.beat_scale + dp(100)  # Add padding
+        self.request_redraw()
+
+    def zoom_to(self, beat_scale, anchor_x=None):
+        """Set the horizontal zoom, keeping the beat under anchor_x where it is on screen
+
+        anchor_x is in widget coordinates and defaults to the viewport centre.
+        """
+        beat_scale = min(self.max_beat_scale, max(self.min_beat_scale, beat_scale))
+        view = self.scroll_view
+        if view is None:
+            self.beat_scale = beat_scale
+            return
+        left = self.visible_window()[0]
+        if anchor_x is None:
+            anchor_x = left + view.width / 2
+        beat = (anchor_x - self.x) / self.beat_scale
+        screen_offset = anchor_x - left
+
+        self.beat_scale = beat_scale  # Resizes the widget through content_width
+        scrollable = self.width - view.width
+        if scrollable > 0:
+            new_left = beat * beat_scale - screen_offset
+            view.scroll_x = min(1.0, max(0.0, new_left / scrollable))
+        self._follow_target = None
+
+    def zoom(self, factor, anchor_x=None):
+        self.zoom_to(self.beat_scale * factor, anchor_x)
+
+    def reset_zoom(self):
+        self.zoom_to(self.default_beat_scale)
+
+    def _note_layout(self):
+        """Pitch rows, category masks and per-note rows, rebuilt when the data changes"""
+        if self._layout is None:
+            rows_by_pitch = pitch_rows(self.visible_pitches)
+            categories = self.note_table.categories(self.drum_pitches)
+            self._layout = {
+                'rows_by_pitch': rows_by_pitch,
+                'drum_set': set(self.drum_pitches),
+                'scale_set': set(self.scale_pitches),
+                'note_rows': rows_by_pitch[self.note_table.pitch],
+                'note_categories': categories,
+                'tracks': {track: np.flatnonzero(categories == track) for track in TRACK_NAMES},
+                'signatures': {},
+            }
+        return self._layout
+
+    def _track_signature(self, track):
+        """Digest of one track's notes and rows; its layer is kept while this is unchanged"""
+        layout = self._note_layout()
+        signatures = layout['signatures']
+        if track not in signatures:
+            notes = layout['tracks'][track]
+            digest = hashlib.sha1(self.note_table.data[notes].tobytes())
+            digest.update(layout['note_rows'][notes].tobytes())
+            signatures[track] = digest.hexdigest()
+        return signatures[track]
+
+    def track_counts(self):
+        """Number of notes in each track"""
+        return {track: len(notes) for track, notes in self._note_layout()['tracks'].items()}
+
+    def set_track_hidden(self, track, hidden):
+        tracks = set(self.hidden_tracks)
+        if hidden:
+            tracks.add(track)
+        else:
+            tracks.discard(track)
+        self.hidden_tracks = sorted(tracks)
+
+    def set_track_muted(self, track, muted):
+        tracks = set(self.muted_tracks)
+        if muted:
+            tracks.add(track)
+        else:
+            tracks.discard(track)
+        self.muted_tracks = sorted(tracks)
+
+    def _attach_track_layers(self, *args):
+        """Put the layers of the shown tracks on the canvas; hidden ones keep their instructions"""
+        self._content_layer.clear()
+        for track, layer in self._track_layers.items():
+            if track not in self.hidden_tracks:
+                self._content_layer.add(layer)
+        self.request_redraw()
+
+    def _shown_notes(self, indices):
+        """Indices outside hidden tracks, as ints"""
+        if not self.hidden_tracks:
+            return [int(i) for i in indices]
+        categories = self._note_layout()['note_categories']
+        return [int(i) for i in indices if categories[i] not in self.hidden_tracks]
+
+    def _note_index(self):
+        layout = self._note_layout()
+        if 'index' not in layout:
+            table = self.note_table
+            layout['index'] = NoteIndex(
+                table.offset, table.offset + table.duration, layout['note_rows'])
+        return layout['index']
+
+    def notes_at(self, x, y):
+        """Indices of the notes drawn under widget position (x, y)"""
+        row_height = dp(18)
+        row = int((y - self.y) // row_height)
+        if (y - self.y) - row * row_height > dp(17):
+            return []
+        beat = (x - self.x) / self.beat_scale
+        return self._shown_notes(self._note_index().at(row, beat))
+
+    def notes_in_rect(self, x1, y1, x2, y2):
+        """Indices of the notes overlapping a widget-space rectangle"""
+        row_height = dp(18)
+        first_row = int((min(y1, y2) - self.y) // row_height)
+        last_row = int((max(y1, y2) - self.y) // row_height)
+        beat_from = (min(x1, x2) - self.x) / self.beat_scale
+        beat_to = (max(x1, x2) - self.x) / self.beat_scale
+        return self._shown_notes(self._note_index().in_rect(first_row, last_row, beat_from, beat_to))
+
+    def request_redraw(self, *args):
+        """Schedule a canvas rebuild for the next frame"""
+        if self._batch_depth:
+            self._redraw_pending = True
+        else:
+            self._redraw_trigger()
+
+    def on_scroll_view(self, instance, view):
+        if self._watched_scroll_view is not None:
+            self._watched_scroll_view.unbind(
+                scroll_x=self._on_viewport_change,
+                scroll_y=self._on_viewport_change,
+                size=self._on_viewport_change)
+        self._watched_scroll_view = view
+        if view is not None:
+            view.bind(
+                scroll_x=self._on_viewport_change,
+                scroll_y=self._on_viewport_change,
+                size=self._on_viewport_change)
+        self.request_redraw()
+
+    def visible_window(self):
+        """Return (left, bottom, right, top) of the area shown by the scroll view"""
+        view = self.scroll_view
+        if view is None:
+            return self.x, self.y, self.right, self.top
+        left = self.x + view.scroll_x * max(0, self.width - view.width)
+        bottom = self.y + view.scroll_y * max(0, self.height - view.height)
+        return left, bottom, left + view.width, bottom + view.height
+
+    def _draw_window(self):
+        """Visible area grown by the margin, clipped to the widget"""
+        left, bottom, right, top = self.visible_window()
+        margin_x = (right - left) * self.viewport_margin
+        margin_y = (top - bottom) * self.viewport_margin
+        return (max(self.x, left - margin_x), max(self.y, bottom - margin_y),
+                min(self.right, right + margin_x), min(self.top, top + margin_y))
+
+    def _on_viewport_change(self, *args):
+        # Only rebuild once the viewport leaves the area drawn last time
+        drawn = self._drawn_window
+        if drawn is None:
+            self.request_redraw()
+            return
+        left, bottom, right, top = self.visible_window()
+        if (max(self.x, left) < drawn[0] or max(self.y, bottom) < drawn[1] or
+                min(self.right, right) > drawn[2] or min(self.top, top) > drawn[3]):
+            self.request_redraw()
+
+    @contextmanager
+    def batch_update(self):
+        """Group property changes so the canvas is rebuilt only once"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._redraw_pending:
+                self._redraw_pending = False
+                self._redraw_trigger()
                 
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos) and not self.is_playing:
             # Find which note was clicked
-            for i, (offset, pitch, duration, velocity) in enumerate(self.notes):
-                if pitch not in self.visible_pitches:
-                    continue
-                    
-                pitch_index = self.visible_pitches.index(pitch)
-                x = self.x + offset * self.beat_scale
-                y = self.y + pitch_index * dp(18)
-                w = duration * self.beat_scale
-                h = dp(17)
-                
-                if (x <= touch.x <= x + w) and (y <= touch.y <= y + h):
-                    self.selected_note = i
-                    self.show_note_details(offset, pitch, duration, velocity)
-                    return True
+            hits = self.notes_at(*touch.pos)
+            if hits:
+                i = hits[0]
+                self.selected_note = i
+                self.request_redraw()  # Notes only; the background stays cached
+                self.show_note_details(i)
+                return True
                     
         return super().on_touch_down(touch)
         
-    def show_note_details(self, offset, pitch, duration, velocity):
+    def _analysis(self):
+        """Analysis of the displayed notes, normally precomputed with the extract"""
+        extract = self._extract
+        if extract is None or extract.note_table is not self.note_table:
+            # Notes were assigned directly rather than through show_extract
+            extract = self._extract = StreamExtract(note_table=self.note_table,
+                                                    drum_pitches=self.drum_pitches)
+        return extract.analysis
+
+    def show_note_details(self, index):
+        offset, pitch, duration, velocity = self.note_table[index]
         pitch_name = self.midi_to_note_name(pitch)
+        analysis = self._analysis()
         
-        # Find interval information if available
+        # Melodic intervals to the neighbouring notes of the same part
         interval_info = ""
-        for interval in self.scale_intervals:
-            if interval[0] == pitch:
-                interval_info = f"\nInterval: {interval[1]} â†’ {interval[2]} ({interval[3]} semitones)"
-                break
+        prev_interval, next_interval = analysis.melodic(index)
+        if prev_interval is not None:
+            interval_info += (f"\nFrom previous: {self.get_interval_name(prev_interval)}"
+                              f" ({prev_interval:+d} semitones)")
+        if next_interval is not None:
+            interval_info += (f"\nTo next: {self.get_interval_name(next_interval)}"
+                              f" ({next_interval:+d} semitones)")
+        histogram = analysis.histogram(analysis.categories[index])
+        if histogram.any():
+            common = [int(size) for size in np.argsort(histogram, kind='stable')[::-1][:3]
+                      if histogram[size]]
+            names = [self.get_interval_name(size) if size < INTERVAL_BUCKETS - 1 else "wider"
+                     for size in common]
+            interval_info += "\nCommon in part: " + ", ".join(
+                f"{name} x{histogram[size]}" for name, size in zip(names, common))
+        
+        chord = analysis.chord(index)
+        chord_info = f"\nChord: {PITCH_CLASS_NAMES[chord[0]]} {chord[1]}" if chord else ""
         
         # Check if drum note
-        drum_info = "\nDrum Note" if pitch in self.drum_pitches else ""
+        drum_info = "\nDrum Note" if pitch in self._note_layout()['drum_set'] else ""
         
         details = (
             f"Pitch: {pitch_name} ({pitch})\n"
@@ -309,6 +2513,7 @@ class PianoRollWidget(BoxLayout):
             f"Duration: {duration:.2f} beats\n"
             f"Velocity: {velocity}"
             f"{drum_info}"
+            f"{chord_info}"
             f"{interval_info}"
         )
         
@@ -345,149 +2550,313 @@ class PianoRollWidget(BoxLayout):
         return intervals.get(abs(semitones), f"{semitones}st")
 
     def _update_canvas(self, *args):
-        self.canvas.after.clear()
-        self.note_labels = {}
-        
-        # Calculate minimum width based on notes
-        max_beat = max((offset + duration) for offset, _, duration, _ in self.notes) if self.notes else 10
-        self.minimum_width = max_beat * self.beat_scale + dp(100)  # Add padding
-        
-        with self.canvas.after:
-            # Draw piano keys background only for visible pitches
-            for i, pitch in enumerate(self.visible_pitches):
-                y = self.y + i * dp(18)
-                Color(*self._key_colors[pitch])
-                Rectangle(
-                    pos=(self.x, y),
-                    size=(self.width, dp(18)))
-                
-                # Draw key border
-                Color(0.3, 0.3, 0.3, 1)
-                Line(rectangle=(self.x, y, self.width, dp(18)), width=0.5)
-                
-                # Draw pitch label for every visible pitch
+        timings = StageTimings('canvas', enabled=self.timing_enabled)
+        with timings.stage('canvas'):
+            redrawn = self._build_canvas()
+        if timings.enabled:
+            timings.counts['instructions'] = self.instruction_count()
+            timings.counts['layers'] = redrawn  # Track layers rebuilt rather than reused
+            self.frame_timings = timings
+
+    def instruction_count(self):
+        """Canvas instructions of the shown note layers and the selection"""
+        return (sum(len(layer.children) for layer in self._content_layer.children) +
+                len(self._selection_layer.children))
+
+    def _build_canvas(self):
+        table = self.note_table
+        layout = self._note_layout()
+
+        # Only the viewport plus a margin is drawn
+        left, bottom, right, top = self._draw_window()
+        self._drawn_window = (left, bottom, right, top)
+        row_height = dp(18)
+        first_row = max(0, int((bottom - self.y) // row_height))
+        last_row = min(len(self.visible_pitches), int((top - self.y) // row_height) + 1)
+
+        self._update_background(layout, left, bottom, right, top, first_row, last_row, row_height)
+
+        # Far zoomed out, notes become a density heatmap so the cost follows pixels
+        density = self.beat_scale < self.density_beat_scale
+        geometry = (left, bottom, right, top, self.x, self.y, self.beat_scale, density)
+        redrawn = 0
+        for track, layer in self._track_layers.items():
+            if track in self.hidden_tracks:
+                continue
+            muted = track in self.muted_tracks
+            key = (geometry, self._track_signature(track), muted)
+            if key == self._track_keys.get(track):
+                continue
+            self._track_keys[track] = key
+            layer.clear()
+            notes = layout['tracks'][track]
+            alpha = self.muted_alpha if muted else self.note_alpha
+            with layer:
+                if density:
+                    self._draw_density(table, layout, notes, track, alpha,
+                                       left, right, first_row, last_row, row_height)
+                else:
+                    self._draw_notes(table, layout, notes, track, alpha,
+                                     left, right, first_row, last_row, row_height)
+            redrawn += 1
+
+        self._selection_layer.clear()
+        if not density:
+            with self._selection_layer:
+                self._draw_selection(table, layout, row_height)
+
+        self._place_playhead()
+        return redrawn
+    
+    def _invalidate_background(self, *args):
+        self._background_key = None
+        self.request_redraw()
+
+    def _update_background(self, layout, left, bottom, right, top, first_row, last_row, row_height):
+        """Render keys, grid and labels into an offscreen texture unless it is still valid"""
+        key = (left, bottom, right, top, self.x, self.y, self.beat_scale, self.content_width)
+        if key == self._background_key:
+            return
+        self._background_key = key
+        self._background_layer.clear()
+        # Beat labels hang below the roll
+        texture_bottom = bottom - dp(16)
+        width, height = int(np.ceil(right - left)), int(np.ceil(top - texture_bottom))
+        if width <= 0 or height <= 0:
+            return
+
+        if max(width, height) > self.max_fbo_size:
+            # Too large for one texture (no viewport to cull to); draw it directly
+            with self._background_layer:
+                self._draw_background(layout, left, bottom, right, top, first_row, last_row, row_height)
+            return
+
+        # One Fbo is kept for the widget's lifetime; scrolling keeps its size
+        # and only a zoom or resize reallocates its texture
+        fbo = self._background_fbo
+        if fbo is None:
+            fbo = self._background_fbo = Fbo(size=(width, height))
+        elif tuple(fbo.size) != (width, height):
+            fbo.size = (width, height)
+        fbo.clear()
+        with fbo:
+            ClearColor(0, 0, 0, 0)
+            ClearBuffers()
+            Translate(-left, -texture_bottom)
+            self._draw_background(layout, left, bottom, right, top, first_row, last_row, row_height)
+        self._background_layer.add(fbo)
+        with self._background_layer:
+            Color(1, 1, 1, 1)
+            Rectangle(texture=fbo.texture, pos=(left, texture_bottom), size=(width, height))
+
+    def _draw_background(self, layout, left, bottom, right, top, first_row, last_row, row_height):
+        """Draw piano keys, pitch labels, scale rows, the beat grid and interval marks"""
+        rows_by_pitch = layout['rows_by_pitch']
+        labels_visible = left <= self.x + dp(40)
+        row_ys = self.y + np.arange(first_row, last_row) * row_height
+        row_pitches = list(self.visible_pitches[first_row:last_row])
+
+        # Draw piano keys background only for visible pitches, one mesh per key colour
+        key_rows = {}
+        for i, pitch in enumerate(row_pitches):
+            key_rows.setdefault(self._key_colors[pitch], []).append(i)
+        for color, rows in key_rows.items():
+            Color(*color)
+            ys = row_ys[rows]
+            draw_meshes(rect_vertices(np.full(len(ys), left), ys, right - left, row_height),
+                        RECT_FILL, 'triangles')
+        
+        # Draw key borders
+        Color(0.3, 0.3, 0.3, 1)
+        draw_meshes(rect_vertices(np.full(len(row_ys), left), row_ys, right - left, row_height),
+                    RECT_OUTLINE, 'lines')
+        
+        # Draw pitch label for every visible pitch
+        if labels_visible:
+            for i, pitch in enumerate(row_pitches):
                 if pitch in self.pitch_range:
                     note_name = self.midi_to_note_name(pitch)
-                    if pitch in self.drum_pitches:
+                    if pitch in layout['drum_set']:
                         Color(1, 0.5, 0.5, 1)  # Red for drums
                     else:
                         Color(0.5, 0.5, 0.5, 1)
-                    self.draw_text(note_name, self.x + dp(5), y + dp(3), dp(12))
-            
-            # Highlight scale rows (full length) - only for visible pitches
-            if self.scale_pitches:
-                Color(1.0, 0.9, 0.2, 0.15)  # Semi-transparent yellow
-                for pitch in self.scale_pitches:
-                    if pitch in self.visible_pitches:
-                        i = self.visible_pitches.index(pitch)
-                        y = self.y + i * dp(18)
-                        Rectangle(
-                            pos=(self.x, y),
-                            size=(self.width, dp(18)))
-            
-            # Draw measure/beat lines
-            max_x = max((o + d) * self.beat_scale for o, _, d, _ in self.notes) if self.notes else 10
-            Color(0.4, 0.4, 0.4, 0.6)
-            for beat in range(0, int(self.minimum_width / self.beat_scale) + 2):
-                x = self.x + beat * self.beat_scale
-                Line(points=[x, self.y, x, self.top], width=1)
+                    self.draw_text(note_name, self.x + dp(5), float(row_ys[i]) + dp(3), dp(12))
+        
+        # Highlight scale rows (full length) - only for visible pitches
+        if self.scale_pitches:
+            scale_rows = rows_by_pitch[np.asarray(list(self.scale_pitches), dtype=np.intp)]
+            scale_rows = scale_rows[(scale_rows >= first_row) & (scale_rows < last_row)]
+            Color(1.0, 0.9, 0.2, 0.15)  # Semi-transparent yellow
+            ys = self.y + scale_rows * row_height
+            draw_meshes(rect_vertices(np.full(len(ys), left), ys, right - left, row_height),
+                        RECT_FILL, 'triangles')
+        
+        # Draw measure/beat lines, thinned out by fours when zoomed out
+        beat_step = 1
+        while beat_step * self.beat_scale < dp(8):
+            beat_step *= 4
+        label_step = 4 * beat_step
+        while label_step * self.beat_scale < dp(40):
+            label_step *= 4
+        Color(0.4, 0.4, 0.4, 0.6)
+        first_beat = max(0, int((left - self.x) / self.beat_scale))
+        first_beat -= first_beat % beat_step
+        last_beat = min(int(self.content_width / self.beat_scale) + 2,
+                        int((right - self.x) / self.beat_scale) + 1)
+        beat_xs = self.x + np.arange(first_beat, max(first_beat, last_beat), beat_step) * self.beat_scale
+        draw_meshes(segment_vertices(beat_xs, np.full(len(beat_xs), bottom),
+                                     beat_xs, np.full(len(beat_xs), top)),
+                    SEGMENT, 'lines')
+        
+        # Label every 4 beats (or every 4 grid lines when zoomed out)
+        for beat in range(first_beat + (-first_beat) % label_step, last_beat, label_step):
+            x = self.x + beat * self.beat_scale
+            self.draw_text(str(beat), x + dp(2), self.y - dp(15), dp(12))
+        
+        # Draw interval lines and labels - only for visible pitches
+        if self.scale_intervals and labels_visible:
+            for interval in self.scale_intervals:
+                start_pitch, end_pitch, semitones = interval[:3]
                 
-                # Label every 4 beats
-                if beat % 4 == 0:
-                    self.draw_text(str(beat), x + dp(2), self.y - dp(15), dp(12))
-            
-            # Draw interval lines and labels - only for visible pitches
-            if self.scale_intervals:
-                for interval in self.scale_intervals:
-                    start_pitch, end_pitch, semitones = interval[:3]
+                start_i = int(rows_by_pitch[start_pitch])
+                end_i = int(rows_by_pitch[end_pitch])
+                
+                # Only draw if both pitches are visible
+                if start_i >= 0 and end_i >= 0:
+                    start_y = self.y + start_i * row_height + dp(9)
+                    end_y = self.y + end_i * row_height + dp(9)
+                    if max(start_y, end_y) < bottom or min(start_y, end_y) > top:
+                        continue
                     
-                    # Only draw if both pitches are visible
-                    if (start_pitch in self.visible_pitches and 
-                        end_pitch in self.visible_pitches):
-                        start_i = self.visible_pitches.index(start_pitch)
-                        end_i = self.visible_pitches.index(end_pitch)
-                        start_y = self.y + start_i * dp(18) + dp(9)
-                        end_y = self.y + end_i * dp(18) + dp(9)
-                        
-                        # Draw connecting line
-                        Color(0.9, 0.2, 0.9, 0.7)  # Purple line
-                        Line(
-                            points=[self.x + dp(10), start_y, 
-                                   self.x + dp(40), end_y],
-                            width=dp(1.5))
-                        
-                        # Draw interval label
-                        interval_name = self.get_interval_name(semitones)
-                        Color(0.9, 0.9, 0.9, 1)  # White text
-                        self.draw_text(interval_name, self.x + dp(25), (start_y + end_y)/2, dp(12), center=True)
-            
-            # Draw notes with velocity-based coloring
-            for i, (offset, pitch, duration, velocity) in enumerate(self.notes):
-                if pitch not in self.visible_pitches:
-                    continue
+                    # Draw connecting line
+                    Color(0.9, 0.2, 0.9, 0.7)  # Purple line
+                    Line(
+                        points=[self.x + dp(10), start_y, 
+                               self.x + dp(40), end_y],
+                        width=dp(1.5))
                     
-                pitch_index = self.visible_pitches.index(pitch)
-                x = self.x + offset * self.beat_scale
-                y = self.y + pitch_index * dp(18)
-                w = duration * self.beat_scale
-                h = dp(17)
-                
-                # Color based on velocity (blue gradient)
-                blue_intensity = 0.5 + (velocity / 200)
-                highlight = 1.0 if i == self.selected_note else 0.7
-                
-                # Custom color mapping
-                if pitch in self.drum_pitches:  # Drums
-                    Color(0.9, 0.2, 0.2, highlight)  # Red
-                elif velocity == 101:  # scale
-                    Color(1.0, 0.9, 0.2, highlight)  # Yellow
-                elif velocity == 102:  # chords
-                    Color(0.2, 0.9, 0.3, highlight)  # Green
-                elif velocity == 103:  # melody
-                    Color(0.2, 0.5, 1.0, highlight)  # Blue
-                else:
-                    Color(0.8, 0.5, blue_intensity, highlight)  # Default
-                
-                # Draw rounded rectangle for note
-                self.draw_rounded_rect(x, y, w, h, dp(3))
-                
-                # Draw note border
-                Color(0, 0, 0, 0.3)
-                Line(rounded_rectangle=(x, y, w, h, dp(3)), width=1)
-                
-                # Draw note label
-                if w > dp(20):  # Only draw label if note is wide enough
-                    note_name = self.midi_to_note_name(pitch)
-                    text_color = (0.1, 0.1, 0.1, 1) if velocity == 101 else (1, 1, 1, 1)
-                    Color(*text_color)
-                    self.draw_text(note_name, x + dp(3), y + dp(2), dp(12))
-            
-            # Playhead line (thicker and more visible)
-            if self.is_playing:
-                Color(1, 0.2, 0.2, 0.9)
-                self.playhead_line = Line(
-                    points=[self.x + self.current_time * self.beat_scale, self.y, 
-                           self.x + self.current_time * self.beat_scale, self.top],
-                    width=dp(3))
-    
-    def draw_rounded_rect(self, x, y, w, h, r):
-        """Draw a rounded rectangle"""
-        # Main rectangle
-        Rectangle(pos=(x + r, y), size=(w - 2*r, h))
-        Rectangle(pos=(x, y + r), size=(w, h - 2*r))
-        
-        # Corners
-        Ellipse(pos=(x, y), size=(2*r, 2*r))
-        Ellipse(pos=(x + w - 2*r, y), size=(2*r, 2*r))
-        Ellipse(pos=(x, y + h - 2*r), size=(2*r, 2*r))
-        Ellipse(pos=(x + w - 2*r, y + h - 2*r), size=(2*r, 2*r))
+                    # Draw interval label
+                    interval_name = self.get_interval_name(semitones)
+                    Color(0.9, 0.9, 0.9, 1)  # White text
+                    self.draw_text(interval_name, self.x + dp(25), (start_y + end_y)/2, dp(12), center=True)
+
+    def _draw_notes(self, table, layout, notes, track, alpha, left, right, first_row, last_row, row_height):
+        """Draw one track's notes inside the window as batched meshes with labels"""
+        # Lay out the track's notes in one vectorized pass, then keep those in view
+        note_rows = layout['note_rows'][notes]
+        xs = self.x + table.offset[notes] * self.beat_scale
+        ws = table.duration[notes] * self.beat_scale
+        ys = self.y + note_rows * row_height
+        in_view = ((note_rows >= first_row) & (note_rows < last_row) &
+                   (xs <= right) & (xs + ws >= left))
+        visible = np.flatnonzero(in_view)
+        if not len(visible):
+            return
+        xs, ws, ys = xs[visible], ws[visible], ys[visible]
+        velocities = table.velocity[notes[visible]]
+        h = dp(17)
+        note_vertices = chamfered_vertices(xs, ys, ws, h, dp(3))
+
+        # Draw notes batched into one mesh per colour class
+        if track in NOTE_COLORS:
+            classes = [(NOTE_COLORS[track], slice(None))]
+        else:
+            # Color based on velocity (blue gradient), one class per velocity
+            classes = [((0.8, 0.5, 0.5 + velocity / 200), velocities == velocity)
+                       for velocity in np.unique(velocities).tolist()]
+        for color, mask in classes:
+            Color(*color, alpha)
+            draw_meshes(note_vertices[mask], CHAMFER_FILL, 'triangles')
+        
+        # Draw note borders
+        Color(0, 0, 0, 0.3)
+        draw_meshes(note_vertices, CHAMFER_OUTLINE, 'lines')
+        
+        # Draw note labels where the note is wide enough
+        pitches = table.pitch[notes[visible]]
+        for i in np.flatnonzero(ws > dp(20)).tolist():
+            note_name = self.midi_to_note_name(int(pitches[i]))
+            text_color = (0.1, 0.1, 0.1, 1) if velocities[i] == 101 else (1, 1, 1, 1)
+            Color(*text_color)
+            self.draw_text(note_name, float(xs[i]) + dp(3), float(ys[i]) + dp(2), dp(12))
+
+    def _draw_selection(self, table, layout, row_height):
+        """Draw the selected note opaque, over its track"""
+        i = self.selected_note
+        if i is None or i >= len(table):
+            return
+        track = int(layout['note_categories'][i])
+        if track in self.hidden_tracks:
+            return
+        velocity = int(table.velocity[i])
+        color = NOTE_COLORS.get(track, (0.8, 0.5, 0.5 + velocity / 200))
+        vertices = chamfered_vertices(
+            self.x + table.offset[i:i + 1] * self.beat_scale,
+            self.y + layout['note_rows'][i:i + 1] * row_height,
+            table.duration[i:i + 1] * self.beat_scale, dp(17), dp(3))
+        Color(*color, 1.0)
+        draw_meshes(vertices, CHAMFER_FILL, 'triangles')
+        Color(0, 0, 0, 0.3)
+        draw_meshes(vertices, CHAMFER_OUTLINE, 'lines')
+
+    def _draw_density(self, table, layout, notes, track, alpha, left, right, first_row, last_row, row_height):
+        """Draw one track's notes inside the window as a heatmap texture
+
+        Each texel is one pitch row by a few pixels of time; its colour is the
+        mean colour of the notes sounding there and its opacity grows with
+        their number.
+        """
+        rows = last_row - first_row
+        texel_width = dp(2)
+        cols = int(np.ceil((right - left) / texel_width))
+        if rows <= 0 or cols <= 0:
+            return
+
+        note_rows = layout['note_rows'][notes]
+        xs = self.x + table.offset[notes] * self.beat_scale
+        ends = xs + table.duration[notes] * self.beat_scale
+        in_view = ((note_rows >= first_row) & (note_rows < last_row) &
+                   (xs <= right) & (ends >= left))
+        visible = np.flatnonzero(in_view)
+        if not len(visible):
+            return
+
+        # Per-note colour from the same palette as the note meshes
+        colors = np.empty((len(visible), 3))
+        if track in NOTE_COLORS:
+            colors[:] = NOTE_COLORS[track]
+        else:
+            colors[:, 0] = 0.8
+            colors[:, 1] = 0.5
+            colors[:, 2] = 0.5 + table.velocity[notes[visible]] / 200
+
+        # Coverage per texel: +1 where a note starts, -1 past its end, then a running sum
+        start_cols = np.clip(((xs[visible] - left) // texel_width).astype(np.intp), 0, cols - 1)
+        end_cols = np.clip(np.ceil((ends[visible] - left) / texel_width).astype(np.intp),
+                           start_cols + 1, cols)
+        texel_rows = note_rows[visible] - first_row
+        sums = np.zeros((4, rows, cols + 1))
+        for channel, weights in enumerate((*colors.T, np.ones(len(visible)))):
+            np.add.at(sums[channel], (texel_rows, start_cols), weights)
+            np.add.at(sums[channel], (texel_rows, end_cols), -weights)
+        sums = np.cumsum(sums[:, :, :cols], axis=2)
+
+        counts = sums[3]
+        pixels = np.zeros((rows, cols, 4))
+        pixels[..., :3] = sums[:3].transpose(1, 2, 0) / np.maximum(counts, 1)[..., None]
+        pixels[..., 3] = np.where(counts > 0.5, 0.45 + 0.55 * np.minimum(counts / 4.0, 1.0), 0)
+        pixels = np.clip(pixels * 255, 0, 255).astype(np.uint8)
+
+        texture = Texture.create(size=(cols, rows), colorfmt='rgba')
+        texture.mag_filter = 'nearest'
+        texture.blit_buffer(pixels.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+        Color(1, 1, 1, alpha / self.note_alpha)
+        Rectangle(texture=texture, pos=(left, self.y + first_row * row_height),
+                  size=(cols * texel_width, rows * row_height))
     
     def draw_text(self, text, x, y, font_size, center=False):
         """Draw text directly on canvas"""
-        from kivy.core.text import Label as CoreLabel
-        label = CoreLabel(text=text, font_size=font_size, font_name='Mono')
-        label.refresh()
-        texture = label.texture
+        texture = text_textures.texture(text, font_size)
         if center:
             pos = (x - texture.width/2, y - texture.height/2)
         else:
@@ -495,136 +2864,110 @@ class PianoRollWidget(BoxLayout):
         Color(0, 0, 0, 1)
         Rectangle(texture=texture, pos=pos, size=texture.size)
     
+    def _place_playhead(self, *args):
+        """Move the playhead line in place; shown only while playing"""
+        x_pos = self.x + self.current_time * self.beat_scale
+        self._playhead_line.points = [x_pos, self.y, x_pos, self.top]
+        self._playhead_color.a = 0.9 if self.is_playing else 0
+        if not self.is_playing:
+            self._follow_target = None
+
     def _update_playhead(self, *args):
-        self.canvas.after.remove(self.playhead_line) if self.playhead_line else None
-        with self.canvas.after:
-            Color(1, 0, 0, 0.9)
-            x_pos = self.x + self.current_time * self.beat_scale
-            self.playhead_line = Line(
-                points=[x_pos, self.y, x_pos, self.top],
-                width=dp(2)
-            )
-        # Auto-scroll to follow playhead
-        if self.scroll_view:
-            playhead_x = self.x + self.current_time * self.beat_scale
-            viewport_width = self.scroll_view.width
-            content_width = self.width
-            scroll_x_px = self.scroll_view.scroll_x * (content_width - viewport_width)
-
-            visible_left = scroll_x_px
-            visible_right = scroll_x_px + viewport_width
-            margin = dp(50)
-
-            if playhead_x < visible_left + margin or playhead_x > visible_right - margin:
-                target_scroll_px = max(0, playhead_x - viewport_width / 2)
-                target_scroll = min(1.0, target_scroll_px / (content_width - viewport_width))
-                self.scroll_view.scroll_x = target_scroll
+        self._place_playhead()
+        self._follow_playhead()
+
+    def _follow_playhead(self):
+        """Ease the scroll view towards the playhead when it nears an edge"""
+        view = self.scroll_view
+        if view is None or not self.is_playing:
+            return
+        now = Clock.get_time()
+        if now - self._last_follow < self.follow_interval:
+            return
+        self._last_follow = now
+
+        viewport_width = view.width
+        scrollable = self.width - viewport_width
+        if scrollable <= 0:
+            return
+        playhead_x = self.current_time * self.beat_scale
+        visible_left = view.scroll_x * scrollable
+        margin = dp(50)
+
+        if (playhead_x < visible_left + margin or
+                playhead_x > visible_left + viewport_width - margin):
+            target_scroll_px = max(0, playhead_x - viewport_width / 2)
+            self._follow_target = min(1.0, target_scroll_px / scrollable)
+
+        if self._follow_target is not None:
+            step = (self._follow_target - view.scroll_x) * self.follow_smoothing
+            if abs(step) * scrollable < 1:
+                view.scroll_x = self._follow_target
+                self._follow_target = None
+            else:
+                view.scroll_x += step
     
     def update_from_stream(self, music_stream):
         """Update piano roll from music21 stream"""
-        self.notes = []
-        self.scale_pitches = []  # Reset scale pitches
-        self.scale_intervals = []  # Reset interval data
-        self.drum_pitches = []    # Reset drum pitches
-        self.visible_pitches = [] # Reset visible pitches
+        extract = None
+        if music_stream:
+            try:
+                extract = extract_stream(music_stream)
+            except Exception as e:
+                print(f"Error updating piano roll: {e}")
+        self.show_extract(extract or StreamExtract())
+
+    def show_extract(self, extract):
+        """Display notes previously gathered by extract_stream"""
         self.selected_note = None
-        if not music_stream:
-            return
-            
-        try:
-            # First pass: collect all scale notes and drum notes
-            scale_notes = []
-            for el in music_stream.recurse().notes:
-                if hasattr(el, 'offset'):
-                    offset = el.offset
-                    duration = el.duration.quarterLength
-                    velocity = el.volume.velocity if hasattr(el.volume, 'velocity') else 100
-                    
-                    # Mark drum notes (velocity 104)
-                    if velocity == 104:
-                        if isinstance(el, note.Note):
-                            if el.pitch.midi not in self.drum_pitches:
-                                self.drum_pitches.append(el.pitch.midi)
-                        elif isinstance(el, chord.Chord):
-                            for n in el.notes:
-                                if n.pitch.midi not in self.drum_pitches:
-                                    self.drum_pitches.append(n.pitch.midi)
-                    
-                    # Collect scale pitches (velocity 101)
-                    if velocity == 101:
-                        if isinstance(el, note.Note):
-                            if el.pitch.midi not in self.scale_pitches:
-                                self.scale_pitches.append(el.pitch.midi)
-                            scale_notes.append((offset, el.pitch.midi, duration, velocity))
-                        elif isinstance(el, chord.Chord):
-                            for n in el.notes:
-                                if n.pitch.midi not in self.scale_pitches:
-                                    self.scale_pitches.append(n.pitch.midi)
-                                scale_notes.append((offset, n.pitch.midi, duration, velocity))
-            
-            # Sort scale notes by offset
-            scale_notes.sort(key=lambda x: x[0])
-            
-            # Calculate intervals between consecutive scale notes
-            for i in range(1, len(scale_notes)):
-                prev_note = scale_notes[i-1]
-                curr_note = scale_notes[i]
-                
-                # Only calculate if they're in the same voice/part (temporal proximity)
-                if abs(curr_note[0] - prev_note[0]) < 1.0:  # Within 1 beat
-                    semitones = curr_note[1] - prev_note[1]
-                    if semitones != 0:  # Skip unison intervals
-                        # Store: (prev_pitch, curr_pitch, semitones, prev_offset, curr_offset)
-                        self.scale_intervals.append((
-                            prev_note[1], 
-                            curr_note[1], 
-                            semitones,
-                            prev_note[0],
-                            curr_note[0]
-                        ))
-            
-            # Second pass: collect all notes and visible pitches
-            all_pitches = set()
-            for el in music_stream.recurse().notes:
-                if hasattr(el, 'offset'):
-                    offset = el.offset
-                    duration = el.duration.quarterLength
-                    velocity = el.volume.velocity if hasattr(el.volume, 'velocity') else 100
-                    
-                    if isinstance(el, note.Note):
-                        self.notes.append((offset, el.pitch.midi, duration, velocity))
-                        all_pitches.add(el.pitch.midi)
-                    elif isinstance(el, chord.Chord):
-                        for n in el.notes:
-                            self.notes.append((offset, n.pitch.midi, duration, velocity))
-                            all_pitches.add(n.pitch.midi)
-            
-            # Add scale pitches even if they don't have notes (for highlighting)
-            for pitch in self.scale_pitches:
-                all_pitches.add(pitch)
-                
-            # Add drum pitches
-            for pitch in self.drum_pitches:
-                all_pitches.add(pitch)
-                
-            # Create sorted list of visible pitches
-            self.visible_pitches = sorted(all_pitches)
-            
-            # Sort notes by pitch for better visualization
-            self.notes.sort(key=lambda x: x[1])
-            
+        self._extract = extract
+        # Assign everything at once so the canvas is rebuilt a single time
+        with self.batch_update():
+            self.note_table = extract.note_table
+            self.scale_pitches = extract.scale_pitches
+            self.scale_intervals = extract.scale_intervals
+            self.drum_pitches = extract.drum_pitches
+            self.visible_pitches = extract.visible_pitches
             # Update height based on visible pitches
-            self.height = max(dp(100), len(self.visible_pitches) * dp(18))
-        except Exception as e:
-            print(f"Error updating piano roll: {e}")
+            self.height = max(dp(100), len(extract.visible_pitches) * dp(18))
 
 class Music21DAW(App):
     status_text = StringProperty("Ready")
+    is_running = BooleanProperty(False)  # A script is executing in the background
+    run_timeout = NumericProperty(30)  # Seconds before a running script is stopped
+    live_mode = BooleanProperty(False)  # Re-run the script shortly after each edit
+    live_delay = NumericProperty(0.6)  # Seconds of idle typing before a live run
+    timing_enabled = BooleanProperty(True)  # Stage timings in the status bar and the timing log
     
+    @property
+    def current_stream(self):
+        """music21 stream of the current score; opened files parse it on first access"""
+        return self.current_result.stream if self.current_result else None
+
+    def build_config(self, config):
+        config.setdefaults('debug', {'stage_timing': 1})
+
+    def build_settings(self, settings):
+        settings.add_json_panel('Music21 DAW', self.config, data=json.dumps([
+            {'type': 'title', 'title': 'Diagnostics'},
+            {'type': 'bool', 'title': 'Stage timings',
+             'desc': f'Show where time goes in the status bar and append it to {TIMING_LOG_NAME}',
+             'section': 'debug', 'key': 'stage_timing'},
+        ]))
+
+    def on_config_change(self, config, section, key, value):
+        if (section, key) == ('debug', 'stage_timing'):
+            self.timing_enabled = config.getboolean(section, key)
+
     def build(self):
         self.title = "Music21 Visual DAW"
         self.layout = MainLayout()
         self.status_label = self.layout.ids.status_label
+        self.timing_enabled = self.config.getboolean('debug', 'stage_timing')
+        self.timing_log = TimingLog(os.path.join(self.user_data_dir, TIMING_LOG_NAME))
+        self._run_status = None  # Run status waiting for the canvas rebuild it caused
+        self._frame_timing_count = 0
+        self.layout.ids.piano_roll.bind(frame_timings=self._on_frame_timings)
         
         # Load demo music21 code with a scale showing intervals
         demo_code = '''from music21 import *
@@ -675,107 +3018,485 @@ result = s
 '''
         self.layout.ids.editor.text = demo_code
         
-        self.current_stream = None
+        self.current_extract = None
+        self.current_result = None
         self.media_player = None
         self.temp_file = None
         self.playback_clock = None
+        self.synth = None  # Resident fluidsynth on Linux
+        self.synth_play_id = None
+        self.play_request_id = 0  # Bumped by Play and Stop to drop a rendering or MIDI file in progress
+        self.linux_process = None
+        self.linux_poll_clock = None
+        self.sound = None  # Kivy Sound playing a built-in rendering
+        self.temp_wav_file = None
         self.playback_start_time = 0
         self.playback_duration = 0
-        self.bpm = 60
-        self.beat_duration = 1.0  # Seconds per beat
+        self.bpm = DEFAULT_BPM
+        self.tempo_map = TempoMap()  # Beat <-> seconds for the current score
+        self.run_job = None
+        self.run_job_live = False
+        self.run_progress_clock = None
+        self.project_job = None  # Background re-run of an opened project's script
+        self.export_queue = ExportQueue()
+        self.export_jobs = []  # Exports shown in the status bar until all have finished
+        self.export_progress_clock = None
 
-        # Auto-run the demo code
-        Clock.schedule_once(lambda dt: self.run_code(), 0.5)
+        # Live mode: edits are debounced, then run in the background
+        self._live_trigger = Clock.create_trigger(self._run_live, self.live_delay)
+        self.layout.ids.editor.bind(text=self._on_editor_text)
+
+        # The window comes up first; music21 loads in the background, then the demo runs
+        if MUSIC21_AVAILABLE:
+            self.status_text = "Loading music21..."
+            threading.Thread(target=self._warm_up, daemon=True).start()
+        else:
+            Clock.schedule_once(lambda dt: self.run_code())
+        if not ANDROID and platform.system() == "Linux":
+            Clock.schedule_once(self._warm_synth, 1)
         return self.layout
 
-    def run_code(self, *args):
+    def _warm_up(self):
+        """Import music21 off the main thread"""
+        timings = self._timings('startup')
+        error = None
+        try:
+            with timings.stage('music21_import'):
+                load_music21()
+        except Exception as e:
+            error = e
+            print(traceback.format_exc())
+        Clock.schedule_once(lambda dt: self._on_warmed_up(timings, error))
+
+    def _on_warmed_up(self, timings, error):
+        if error is not None:
+            self.status_text = f"Error loading music21: {error}"
+            return
+        self.timing_log.append(timings)
+        # Auto-run the demo code unless the user got there first
+        if self.run_job is None and self.current_result is None:
+            self.run_code()
+
+    def on_live_mode(self, instance, value):
+        if value:
+            self._live_trigger()
+        else:
+            self._live_trigger.cancel()
+
+    def _on_editor_text(self, instance, text):
+        if self.live_mode:
+            # Restart the debounce timer on every keystroke
+            self._live_trigger.cancel()
+            self._live_trigger()
+
+    def _run_live(self, dt):
+        self.run_code(live=True)
+
+    def run_code(self, *args, live=False):
         if not MUSIC21_AVAILABLE:
             self.status_text = "Error: music21 not installed"
             return
 
-        try:
-            env = {
-                'stream': stream,
-                'note': note,
-                'tempo': tempo,
-                'chord': chord,
-                'dynamics': dynamics,
-                'articulations': articulations,
-                '__builtins__': __builtins__
-            }
-            local = {}
-            
-            exec(self.layout.ids.editor.text, env, local)
-            
-            self.current_stream = local.get('result')
-            if self.current_stream:
-                self.status_text = "Successfully parsed music stream"
-                self.layout.ids.piano_roll.scroll_view = self.layout.ids.piano_scroll
-                self.layout.ids.piano_roll.update_from_stream(self.current_stream)
-                
-                # Get BPM from stream (default to 60 if not found)
-                self.bpm = 60
-                for mark in self.current_stream.flat.getElementsByClass(tempo.MetronomeMark):
-                    if mark.number:
-                        self.bpm = mark.number
-                        break
-                
-                # Calculate beat duration in seconds
-                self.beat_duration = 60.0 / self.bpm
-                
-                # Store total duration in beats
-                self.playback_duration = self.current_stream.duration.quarterLength
+        # A newer run supersedes the one in flight
+        if self.run_job:
+            self.run_job.cancel()
+            self.run_job = None
+            self.is_running = False
+
+        source = self.layout.ids.editor.text
+        cached = script_results.get(source_hash(source))
+        if cached is not None:
+            if self.run_progress_clock:
+                self.run_progress_clock.cancel()
+                self.run_progress_clock = None
+            if cached is not self.current_result:
+                self._show_result(cached)
+            self.status_text = f"Parsed music stream (cached, {script_results.stats()})"
+            return
+
+        job = ScriptJob(source, timeout=self.run_timeout, timings=self._timings('run'))
+        self.run_job = job
+        self.run_job_live = live
+        # Live runs are superseded by the next edit rather than cancelled by hand
+        self.is_running = not live
+        self.status_text = "Live: running..." if live else "Running..."
+        if self.run_progress_clock:
+            self.run_progress_clock.cancel()
+        self.run_progress_clock = Clock.schedule_interval(self._update_run_progress, 0.25)
+        job.start(lambda job: Clock.schedule_once(lambda dt: self._on_run_finished(job)))
+
+    def cancel_run(self, *args):
+        """Stop the script running in the background"""
+        if self.run_job:
+            self.run_job.cancel()
+            self.status_text = "Cancelling..."
+
+    def _update_run_progress(self, dt):
+        job = self.run_job
+        if job and not job.cancelled:
+            prefix = "Live: running" if self.run_job_live else job.label
+            self.status_text = f"{prefix}... {job.elapsed():.1f}s"
+
+    def _end_job(self, job):
+        """Clear the in-flight job; False if a newer one has superseded it"""
+        if job is not self.run_job:
+            return False
+        self.run_job = None
+        self.is_running = False
+        if self.run_progress_clock:
+            self.run_progress_clock.cancel()
+            self.run_progress_clock = None
+        return True
+
+    def _on_run_finished(self, job):
+        """Swap in the result of a background run; called on the main thread"""
+        if not self._end_job(job):
+            return
+
+        if job.error is not None:
+            if self.run_job_live:
+                # Keep showing the last good result until the code parses cleanly
+                if isinstance(job.error, SyntaxError):
+                    self.status_text = f"Live: syntax error on line {job.error.lineno}"
+                else:
+                    self.status_text = f"Live: {type(job.error).__name__}: {job.error}"
+            elif isinstance(job.error, ScriptCancelled):
+                self.status_text = f"{job.error} after {job.elapsed():.1f}s"
             else:
-                self.status_text = "Warning: No 'result' variable found"
-        except Exception as e:
-            self.status_text = f"Error: {str(e)}"
-            print(traceback.format_exc())
+                self.status_text = f"Error: {str(job.error)}"
+            return
+
+        if job.result:
+            result = ScriptResult(source_hash(job.source), job.result, job.extract)
+            script_results.put(result.source_hash, result)
+            with job.timings.stage('update_from_stream'):
+                self._show_result(result)
+            self.status_text = "Successfully parsed music stream"
+            self._report_timings(job.timings, wait_for_canvas=True)
+        elif self.run_job_live:
+            self.status_text = "Live: no 'result' variable yet"
+            self._report_timings(job.timings)
+        else:
+            self.current_result = None
+            self.status_text = "Warning: No 'result' variable found"
+            self._report_timings(job.timings)
+
+    def _timings(self, operation):
+        return StageTimings(operation, enabled=self.timing_enabled)
+
+    def _report_timings(self, timings, wait_for_canvas=False):
+        """Append stage timings to the status bar and the timing log
+
+        With wait_for_canvas the status is completed by the next canvas rebuild.
+        """
+        if not timings.enabled or not timings.stages:
+            return
+        self.timing_log.append(timings)
+        message = self.status_text
+        self.status_text = f"{message} ({timings.summary()})"
+        self._run_status = (message, timings, self.status_text) if wait_for_canvas else None
+
+    def _on_frame_timings(self, widget, timings):
+        if timings is None:
+            return
+        if self._run_status is None:
+            # Scrolling and zooming rebuild every frame; a sample of them is enough
+            if self._frame_timing_count % FRAME_TIMING_SAMPLE == 0:
+                self.timing_log.append(timings)
+            self._frame_timing_count += 1
+            return
+        self.timing_log.append(timings)
+        message, run_timings, shown = self._run_status
+        self._run_status = None
+        if self.status_text == shown:  # Nothing else has reported since
+            run_timings.merge(timings)
+            self.status_text = f"{message} ({run_timings.summary()})"
+
+    def open_file(self, *args):
+        """Choose a MIDI or MusicXML file to show in the piano roll"""
+        filters = [f'*{ext}' for ext in SCORE_EXTENSIONS + (PROJECT_EXTENSION,)]
+        filters += [pattern.upper() for pattern in filters]
+        OpenFilePopup(start_path=self._export_dir(), filters=filters,
+                      on_choose=self.open_score).open()
+
+    def open_score(self, path):
+        """Load a score file in the background, superseding any run in flight"""
+        if path.lower().endswith(PROJECT_EXTENSION):
+            self.open_project(path)
+            return
+        if self.run_job:
+            self.run_job.cancel()
+        job = ScoreFileJob(path, timings=self._timings('open'))
+        self.run_job = job
+        self.run_job_live = False
+        self.is_running = True
+        self.status_text = f"Opening {os.path.basename(path)}..."
+        if self.run_progress_clock:
+            self.run_progress_clock.cancel()
+        self.run_progress_clock = Clock.schedule_interval(self._update_run_progress, 0.25)
+        job.start(lambda job: Clock.schedule_once(lambda dt: self._on_score_opened(job)))
+
+    def _on_score_opened(self, job):
+        """Show a score file loaded in the background; called on the main thread"""
+        if not self._end_job(job):
+            return
+        name = os.path.basename(job.path)
+        if job.error is not None:
+            if isinstance(job.error, ScriptCancelled):
+                self.status_text = f"{job.error} after {job.elapsed():.1f}s"
+            else:
+                self.status_text = f"Could not open {name}: {job.error}"
+            return
+
+        with job.timings.stage('update_from_stream'):
+            self._show_result(job.result)
+        self.status_text = f"Opened {name} ({len(job.extract.note_table)} notes)"
+        self._report_timings(job.timings, wait_for_canvas=True)
+
+    def open_project(self, path):
+        """Show a saved project at once; its script is re-run in the background"""
+        name = os.path.basename(path)
+        timings = self._timings('open_project')
+        try:
+            with timings.stage('read'):
+                project = read_project(path)
+        except (OSError, ProjectFileError) as e:
+            self.status_text = f"Could not open {name}: {e}"
+            return
+
+        # The project supersedes whatever was running
+        if self.run_job:
+            self.run_job.cancel()
+            self._end_job(self.run_job)
+        if self.project_job:
+            self.project_job.cancel()
+            self.project_job = None
+
+        self.layout.ids.editor.text = project.source
+        if project.extract is None:
+            # Saved without notes; run the script as Load always did
+            self.status_text = f"Opened {name}"
+            self.run_code()
+            return
+
+        with timings.stage('update_from_stream'):
+            self._show_result(project)
+        script_results.put(project.source_hash, project)
+        self.status_text = f"Opened {name} ({len(project.extract.note_table)} notes)"
+        self._report_timings(timings, wait_for_canvas=True)
+
+        if MUSIC21_AVAILABLE:
+            job = ScriptJob(project.source, timeout=self.run_timeout, timings=self._timings('project_rerun'))
+            self.project_job = job
+            job.start(lambda job: Clock.schedule_once(lambda dt: self._on_project_rerun(job, project)))
+
+    def _on_project_rerun(self, job, project):
+        """Give an opened project the stream of its script; called on the main thread"""
+        if job is not self.project_job:
+            return
+        self.project_job = None
+        self.timing_log.append(job.timings)
+        if job.error is None and job.result:
+            project.attach_stream(job.result)
+        elif self.current_result is project and not isinstance(job.error, ScriptCancelled):
+            # The saved notes stay up; only music21 features are unavailable
+            problem = job.error or "no 'result' variable"
+            self.status_text = f"Project script failed on re-run: {problem}"
+
+    def _show_result(self, result):
+        """Make a script result the current score"""
+        self.current_result = result
+        self.current_extract = result.extract
+        self.layout.ids.piano_roll.show_extract(self.current_extract)
+        
+        # Tempo changes map playhead time to beats
+        self.tempo_map = self.current_extract.tempo_map
+        self.bpm = self.tempo_map.bpm_at(0)
+        
+        # Store total duration in beats
+        self.playback_duration = self.current_extract.duration
+
+    def _export_dir(self):
+        if ANDROID:
+            from android.storage import primary_external_storage_path
+            return primary_external_storage_path()
+        return os.path.expanduser("~")
+
+    def _audible_notes(self, muted=()):
+        """Note table and categories of the current score without the muted tracks"""
+        extract = self.current_extract
+        table = extract.note_table
+        categories = table.categories(extract.drum_pitches)
+        if len(muted):
+            keep = ~np.isin(categories, muted)
+            table, categories = NoteTable(table.data[keep]), categories[keep]
+        return table, categories
+
+    def _current_wav_renderer(self, muted=()):
+        """Function rendering the current score as WAV with the built-in synthesizer
+
+        The notes are gathered now, so the function can run on a worker thread.
+        """
+        table, categories = self._audible_notes(muted)
+        starts = self.tempo_map.seconds_for(table.offset)
+        ends = self.tempo_map.seconds_for(table.offset + table.duration)
+        return lambda: render_wav(
+            starts,
+            ends - starts,
+            table.pitch,
+            table.velocity,
+            categories)
+
+    def show_tracks(self, *args):
+        """Popup to hide or mute the tracks of the piano roll"""
+        TracksPopup(roll=self.layout.ids.piano_roll).open()
+
+    def export_score(self, *args):
+        """Export the current score as MIDI, MusicXML and audio from the built-in synthesizer"""
+        self.export_formats(('midi', 'musicxml', 'wav'))
 
     def export_midi(self, *args):
-        if not self.current_stream:
+        self.export_formats(('midi',))
+
+    def export_formats(self, formats):
+        """Queue exports of the current score; progress is shown in the status bar"""
+        if not self.current_result:
             self.status_text = "No music to export"
             return
-
+        result = self.current_result
+        extract = self.current_extract
         try:
-            if ANDROID:
-                from android.storage import primary_external_storage_path
-                export_dir = primary_external_storage_path()
-            else:
-                export_dir = os.path.expanduser("~")
-                
-            midi_file = os.path.join(export_dir, "music21_demo.mid")
-            self.current_stream.write('midi', fp=midi_file)
-            self.status_text = f"Exported to: {midi_file}"
-        except Exception as e:
+            key = score_key(result)
+        except OSError as e:
             self.status_text = f"Export failed: {str(e)}"
-            print(traceback.format_exc())
+            return
+
+        queue = self.export_queue
+        def converted(convert):
+            def produce():
+                with queue.music21_lock:
+                    return convert()
+            return produce
+        producers = {
+            'midi': converted(result.midi_bytes),
+            'musicxml': converted(lambda: musicxml_bytes(result.stream)),
+            'wav': lambda: extract_wav(extract),
+        }
+        jobs = [
+            queue.submit(key, fmt,
+                         os.path.join(self._export_dir(), EXPORT_BASENAME + EXPORT_EXTENSIONS[fmt]),
+                         producers[fmt], self._timings(f'export_{fmt}'))
+            for fmt in formats]
+        self._track_exports(jobs)
+
+    def _track_exports(self, jobs):
+        """Show queued export jobs in the status bar until they have all finished"""
+        # Jobs of an earlier export still running stay on the status bar
+        self.export_jobs = [job for job in self.export_jobs if job.pending and job not in jobs] + jobs
+        if self.export_progress_clock is None:
+            self.export_progress_clock = Clock.schedule_interval(self._update_export_progress, 0.25)
+        self._update_export_progress(0)
+
+    def _update_export_progress(self, dt):
+        jobs = self.export_jobs
+        if any(job.pending for job in jobs):
+            states = []
+            for job in jobs:
+                if job.state == 'running':
+                    states.append(f"{job.format} {job.elapsed():.1f}s")
+                else:
+                    states.append(f"{job.format} {job.state}")
+            self.status_text = "Saving: " + ", ".join(states)
+            return
+        if self.export_progress_clock is not None:
+            self.export_progress_clock.cancel()
+            self.export_progress_clock = None
+        self.export_jobs = []
+
+        timings = self._timings('export')
+        written = []
+        failures = []
+        for job in jobs:
+            if job.state == 'failed':
+                failures.append(f"{job.format} failed: {job.error}")
+                continue
+            written.append(os.path.basename(job.path))
+            if job.state == 'done':
+                self.timing_log.append(job.timings)
+                if timings.enabled:
+                    timings.stages[job.format] = job.elapsed()
+        message = ""
+        if written:
+            message = f"Saved to {self._export_dir()}: {', '.join(written)}"
+            if all(job.state == 'unchanged' for job in jobs):
+                message += " (unchanged)"
+        self.status_text = "; ".join(([message] if message else []) + failures)
+        self._report_timings(timings)
 
     def play_audio(self, *args):
-        if not self.current_stream:
+        if not self.current_result:
             self.status_text = "No music to play"
             return
 
         self.stop_audio()
+        timings = self._timings('play')
             
         try:
-            # Create temp MIDI file
-            if ANDROID:
-                from android.storage import app_storage_path
-                self.temp_file = os.path.join(app_storage_path(), "playback.mid")
-            else:
-                self.temp_file = os.path.join(tempfile.gettempdir(), "playback.mid")
-                
-            self.current_stream.write('midi', fp=self.temp_file)
-
+            # Only Android's MediaPlayer and TiMidity++ play a MIDI file; the
+            # other backends sequence or render the note table
             if ANDROID:
-                self._play_android()
+                self._prepare_midi_file(self._play_android)
             elif platform.system() == "Linux":
-                self._play_linux()
+                self._play_linux(timings)
             else:
-                self.status_text = "Playback not supported"
+                self._play_rendered(timings)
         except Exception as e:
             self.status_text = f"Playback error: {str(e)}"
             print(traceback.format_exc())
+        self._report_timings(timings)
+
+    def _prepare_midi_file(self, start):
+        """Write the score as MIDI to temp_file on a worker thread, then call start() from the clock
+
+        The conversion holds the export queue's music21 lock, as an export or
+        save may be converting the same stream.
+        """
+        if ANDROID:
+            from android.storage import app_storage_path
+            path = os.path.join(app_storage_path(), "playback.mid")
+        else:
+            path = os.path.join(tempfile.gettempdir(), "playback.mid")
+        self.temp_file = path
+        result = self.current_result
+        lock = self.export_queue.music21_lock
+        midi_timings = self._timings('play')
+        self.play_request_id += 1
+        request_id = self.play_request_id
+
+        def work():
+            error = None
+            try:
+                with midi_timings.stage('midi'):
+                    with lock:
+                        data = result.midi_bytes()
+                    write_atomically(path, [data])
+            except Exception as e:
+                error = str(e)
+                print(traceback.format_exc())
+            Clock.schedule_once(lambda dt: self._on_midi_file_ready(request_id, midi_timings, error, start))
+
+        threading.Thread(target=work, daemon=True).start()
+        self.status_text = "Preparing MIDI..."
+
+    def _on_midi_file_ready(self, request_id, timings, error, start):
+        """Start a MIDI file backend, unless Play or Stop was pressed since"""
+        if request_id != self.play_request_id:
+            return
+        if error:
+            self.status_text = f"Playback error: {error}"
+            return
+        start()
+        self._report_timings(timings)
 
     def _play_android(self):
         try:
@@ -838,8 +3559,8 @@ result = s
         def update_playhead(dt):
             elapsed = Clock.get_time() - self.playback_start_time
             
-            # Convert real-time to musical time using BPM
-            current_beat = elapsed / self.beat_duration
+            # Convert real-time to musical time through the tempo map
+            current_beat = self.tempo_map.beat_at(elapsed)
             
             # Limit to total duration
             self.layout.ids.piano_roll.current_time = min(current_beat, self.playback_duration)
@@ -867,42 +3588,141 @@ result = s
             self.media_player.release()
             self.media_player = None
 
-    def _play_linux(self):
+    def _play_linux(self, timings):
         try:
-            self.layout.ids.piano_roll.is_playing = True
-            self.playback_start_time = Clock.get_time()
-            self._start_playhead_animation()
-            
-            # Try fluidsynth first
+            # Try the resident fluidsynth first
             try:
-                soundfont = "/usr/share/sounds/sf2/FluidR3_GM.sf2"
-                self.linux_process = subprocess.Popen(
-                    ["fluidsynth", "-a", "alsa", "-g", "1.0", soundfont, self.temp_file],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
+                with timings.stage('synth_start'):
+                    if self.synth is None:
+                        self.synth = FluidSynthEngine()
+                    self.synth.start()
+                self.layout.ids.piano_roll.is_playing = True
+                self.playback_start_time = Clock.get_time()
+                self._start_playhead_animation()
+                self.synth_play_id = self.synth.play(
+                    self._audible_notes(self.layout.ids.piano_roll.muted_tracks)[0],
+                    self.tempo_map,
+                    on_finished=lambda play_id, error: Clock.schedule_once(
+                        lambda dt: self._on_synth_finished(play_id, error)))
                 self.status_text = "Playing with FluidSynth"
                 return
             except FileNotFoundError:
-                pass
+                self.synth = None
                 
-            # Fallback to timidity
-            try:
-                self.linux_process = subprocess.Popen(
-                    ["timidity", self.temp_file],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
-                self.status_text = "Playing with TiMidity++"
+            # Fallback to timidity, which needs the MIDI file
+            if shutil.which("timidity"):
+                self._prepare_midi_file(self._play_timidity)
                 return
-            except FileNotFoundError:
-                pass
                 
-            self.status_text = "No MIDI player found"
-            self.layout.ids.piano_roll.is_playing = False
+            # Fallback to the built-in renderer
+            self._play_rendered(timings)
         except Exception as e:
             self.status_text = f"Linux playback error: {str(e)}"
             self.layout.ids.piano_roll.is_playing = False
+            if self.playback_clock:
+                self.playback_clock.cancel()
+
+    def _play_timidity(self):
+        try:
+            self.linux_process = subprocess.Popen(
+                ["timidity", self.temp_file],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            self._play_rendered(self._timings('play'))
+            return
+        self.layout.ids.piano_roll.is_playing = True
+        self.playback_start_time = Clock.get_time()
+        self._start_playhead_animation()
+        self.linux_poll_clock = Clock.schedule_interval(self._poll_linux_process, 0.2)
+        self.status_text = "Playing with TiMidity++"
+
+    def _play_rendered(self, timings):
+        """Play a WAV rendered by the built-in synthesizer through Kivy's audio
+
+        The rendering runs on a worker thread; the sound is started from the
+        clock once the file is written.
+        """
+        self.temp_wav_file = path = os.path.join(tempfile.gettempdir(), "playback.wav")
+        render = self._current_wav_renderer(self.layout.ids.piano_roll.muted_tracks)
+        render_timings = self._timings('play')
+        self.play_request_id += 1
+        play_id = self.play_request_id
+
+        def work():
+            error = None
+            try:
+                with render_timings.stage('render'):
+                    write_atomically(path, [render()])
+            except Exception as e:
+                error = str(e)
+            Clock.schedule_once(lambda dt: self._on_render_finished(play_id, path, render_timings, error))
+
+        threading.Thread(target=work, daemon=True).start()
+        self.status_text = "Rendering audio..."
+
+    def _on_render_finished(self, play_id, path, timings, error):
+        """Start the sound of a finished rendering, unless Play or Stop was pressed since"""
+        if play_id != self.play_request_id:
+            return
+        if error:
+            self.status_text = f"Playback error: {error}"
+            return
+        from kivy.core.audio import SoundLoader
+        sound = SoundLoader.load(path)
+        if not sound:
+            self.status_text = "No audio output available"
+            return
+        self.sound = sound
+        sound.bind(on_stop=self._on_sound_stop)
+        sound.play()
+        self.layout.ids.piano_roll.is_playing = True
+        self.playback_start_time = Clock.get_time()
+        self._start_playhead_animation()
+        self.status_text = "Playing built-in synth"
+        self._report_timings(timings)
+
+    def _on_sound_stop(self, sound):
+        if sound is self.sound:
+            self.sound = None
+            self._on_playback_completed()
+
+    def _on_synth_finished(self, play_id, error):
+        """Called on the main thread when a fluidsynth sequence ends"""
+        if play_id != self.synth_play_id:
+            return  # A later Play or Stop took over
+        self.synth_play_id = None
+        if error:
+            self._on_playback_error(error, "restarting synth on next Play")
+        else:
+            self._on_playback_completed()
+
+    def _poll_linux_process(self, dt):
+        """Detect the end of a TiMidity++ run"""
+        if self.linux_process is None:
+            return False
+        code = self.linux_process.poll()
+        if code is None:
+            return
+        self.linux_process = None
+        self.linux_poll_clock = None
+        if code == 0:
+            self._on_playback_completed()
+        else:
+            self._on_playback_error("timidity exit code", code)
+        return False
+
+    def _warm_synth(self, *args):
+        """Start fluidsynth ahead of the first Play so the soundfont is loaded"""
+        timings = self._timings('synth_warmup')
+        try:
+            with timings.stage('synth_start'):
+                self.synth = FluidSynthEngine()
+                self.synth.start()
+            self.timing_log.append(timings)
+        except Exception:
+            self.synth = None
 
     def stop_audio(self, *args):
         self.layout.ids.piano_roll.is_playing = False
@@ -911,6 +3731,7 @@ result = s
         if self.playback_clock:
             self.playback_clock.cancel()
             self.playback_clock = None
+        self.play_request_id += 1
             
         if ANDROID and self.media_player:
             try:
@@ -921,40 +3742,57 @@ result = s
             finally:
                 self.media_player = None
                 
-        elif hasattr(self, 'linux_process'):
-            try:
-                self.linux_process.terminate()
-            except:
-                pass
+        else:
+            if self.sound is not None:
+                sound, self.sound = self.sound, None
+                sound.stop()
+                sound.unload()
+            if self.synth is not None:
+                self.synth_play_id = None
+                self.synth.stop()
+            if self.linux_poll_clock:
+                self.linux_poll_clock.cancel()
+                self.linux_poll_clock = None
+            if self.linux_process is not None:
+                try:
+                    self.linux_process.terminate()
+                except:
+                    pass
+                self.linux_process = None
                 
         self.status_text = "Playback stopped"
         
     def save_code(self):
-        """Save editor content to file"""
-        try:
-            if ANDROID:
-                from android.storage import primary_external_storage_path
-                save_path = os.path.join(primary_external_storage_path(), "last_music21_code.py")
-            else:
-                save_path = os.path.join(os.path.expanduser("~"), "last_music21_code.py")
-                
-            with open(save_path, "w") as f:
-                f.write(self.layout.ids.editor.text)
-                
-            self.status_text = f"Code saved to {save_path}"
-        except Exception as e:
-            self.status_text = f"Save error: {str(e)}"
+        """Save the editor script as a project, with its notes when they are on screen
+
+        The file is written by the export queue, since bundling the MIDI can
+        mean a music21 conversion.
+        """
+        source = self.layout.ids.editor.text
+        result = self.current_result
+        if result is not None and result.source_hash != source_hash(source):
+            result = None  # The notes shown are not from this text
+        queue = self.export_queue
+
+        def produce():
+            if result is None:
+                return project_bytes(source)
+            with queue.music21_lock:
+                midi_data = result.midi_bytes()
+            return project_bytes(source, result.extract, midi_data)
+
+        key = source_hash(source) + (":notes" if result is not None else "")
+        path = os.path.join(self._export_dir(), PROJECT_FILENAME)
+        self._track_exports([queue.submit(key, 'project', path, produce, self._timings('save'))])
             
     def load_code(self):
-        """Load editor content from file"""
+        """Open the saved project, or the bare script saved by earlier versions"""
         try:
-            if ANDROID:
-                from android.storage import primary_external_storage_path
-                load_path = os.path.join(primary_external_storage_path(), "last_music21_code.py")
-            else:
-                load_path = os.path.join(os.path.expanduser("~"), "last_music21_code.py")
-                
-            if os.path.exists(load_path):
+            project_path = os.path.join(self._export_dir(), PROJECT_FILENAME)
+            load_path = os.path.join(self._export_dir(), "last_music21_code.py")
+            if os.path.exists(project_path):
+                self.open_project(project_path)
+            elif os.path.exists(load_path):
                 with open(load_path, "r") as f:
                     self.layout.ids.editor.text = f.read()
                 self.status_text = f"Code loaded from {load_path}"
@@ -964,14 +3802,44 @@ result = s
         except Exception as e:
             self.status_text = f"Load error: {str(e)}"
 
+    def on_start(self):
+        from kivy.core.window import Window
+        Window.bind(on_key_down=self._on_key_down)
+
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        """Ctrl + plus/minus zooms the piano roll, Ctrl + 0 resets the zoom"""
+        if 'ctrl' not in modifiers:
+            return False
+        roll = self.layout.ids.piano_roll
+        if codepoint in ('+', '='):
+            roll.zoom(roll.zoom_step)
+        elif codepoint == '-':
+            roll.zoom(1 / roll.zoom_step)
+        elif codepoint == '0':
+            roll.reset_zoom()
+        else:
+            return False
+        return True
+
     def on_stop(self):
         """Clean up when app stops"""
+        self.cancel_run()
+        if self.project_job:
+            self.project_job.cancel()
+        self.export_queue.shutdown()
         self.stop_audio()
-        if self.temp_file and os.path.exists(self.temp_file):
-            try:
-                os.remove(self.temp_file)
-            except:
-                pass
+        self.timing_log.close()
+        shutdown_pool()
+        if self.synth is not None:
+            self.synth.shutdown()
+        for path in (self.temp_file, self.temp_wav_file):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except:
+                    pass
 
 if __name__ == "__main__":
+    if '--batch' in sys.argv[1:]:
+        sys.exit(batch_main(sys.argv[1:]))
     Music21DAW().run()